@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from sqlalchemy import Date, case, delete, func, insert, select, union_all, update
+from models import db, Departure, Order, OrderArchive, SalesDaily, Tour, ORDER_STATUSES
+
+# Статусы, заказы в которых считаются выручкой
+REVENUE_STATUSES = ('Подтвержден', 'Завершен')
+CANCELLED_STATUS = 'Отменен'
+
+# Период панели аналитики по умолчанию
+DEFAULT_PERIOD_DAYS = 365
+
+_COUNTERS = ('orders_count', 'guests_count', 'revenue')
+
+
+def _order_day(created_at=Order.created_at):
+    # date() есть и в PostgreSQL, и в SQLite; type_ превращает строку SQLite в date
+    return func.date(created_at, type_=Date)
+
+
+def _upsert(deltas):
+    """Прибавляет приращения к строкам витрины, создавая недостающие.
+
+    deltas — {(day, tour_id, status): [orders, guests, revenue]}.
+    На PostgreSQL и SQLite это один INSERT ... ON CONFLICT DO UPDATE
+    через executemany: параллельные транзакции не теряют приращения
+    друг друга и не спотыкаются о первичный ключ.
+    """
+    rows = [
+        {'day': day, 'tour_id': tour_id, 'status': status,
+         'orders_count': orders, 'guests_count': guests, 'revenue': revenue}
+        for (day, tour_id, status), (orders, guests, revenue) in deltas.items()
+        if orders or guests or revenue
+    ]
+    if not rows:
+        return
+
+    table = SalesDaily.__table__
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # Диалект загружается здесь, а не при импорте: приложению нужен только свой
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.tour_id, table.c.status],
+            set_={name: table.c[name] + statement.excluded[name] for name in _COUNTERS},
+        )
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.day == row['day'], table.c.tour_id == row['tour_id'],
+                   table.c.status == row['status'])
+            .values({name: table.c[name] + row[name] for name in _COUNTERS})
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table), row)
+
+
+def _add(deltas, key, sign, orders, guests, revenue):
+    counters = deltas.setdefault(key, [0, 0, 0.0])
+    counters[0] += sign * orders
+    counters[1] += sign * (guests or 0)
+    counters[2] += sign * (revenue or 0)
+
+
+def order_created(order):
+    """Учитывает новый заказ. order.created_at должен быть уже заполнен"""
+    deltas = {}
+    _add(deltas, (order.created_at.date(), order.tour_id, order.status), 1,
+         1, order.guests_count, order.total_price)
+    _upsert(deltas)
+
+
+def order_status_changed(order, old_status, new_status):
+    """Переносит заказ из итогов старого статуса в итоги нового"""
+    day = order.created_at.date()
+    deltas = {}
+    _add(deltas, (day, order.tour_id, old_status), -1, 1, order.guests_count, order.total_price)
+    _add(deltas, (day, order.tour_id, new_status), 1, 1, order.guests_count, order.total_price)
+    _upsert(deltas)
+
+
+def order_deleted(order):
+    deltas = {}
+    _add(deltas, (order.created_at.date(), order.tour_id, order.status), -1,
+         1, order.guests_count, order.total_price)
+    _upsert(deltas)
+
+
+def _groups(conditions):
+    """Итоги выбранных заказов по (день, тур, статус) одним GROUP BY"""
+    day = _order_day()
+    return db.session.execute(
+        select(day, Order.tour_id, Order.status, func.count(Order.id),
+               func.sum(Order.guests_count), func.sum(Order.total_price))
+        .where(*conditions)
+        .group_by(day, Order.tour_id, Order.status)
+    ).all()
+
+
+def bulk_status_changed(conditions, new_status):
+    """То же, что order_status_changed, для всех заказов под условиями.
+
+    Вызывается до UPDATE статусов, с теми же условиями.
+    """
+    deltas = {}
+    for day, tour_id, status, orders, guests, revenue in _groups(conditions):
+        _add(deltas, (day, tour_id, status), -1, orders, guests, revenue)
+        _add(deltas, (day, tour_id, new_status), 1, orders, guests, revenue)
+    _upsert(deltas)
+
+
+def bulk_deleted(conditions):
+    """Вычитает заказы под условиями; вызывается до DELETE"""
+    deltas = {}
+    for day, tour_id, status, orders, guests, revenue in _groups(conditions):
+        _add(deltas, (day, tour_id, status), -1, orders, guests, revenue)
+    _upsert(deltas)
+
+
+def rebuild(bind=None):
+    """Пересобирает витрину из заказов и их архива одним INSERT ... SELECT.
+
+    Заказы, изменённые во время пересборки, могут учесться неточно,
+    поэтому запускать её лучше при небольшой нагрузке. Коммит — на
+    вызывающем. bind — сессия или соединение (миграции работают с
+    соединением), по умолчанию db.session. Возвращает число строк витрины.
+    """
+    bind = bind if bind is not None else db.session
+    orders = union_all(*(
+        select(model.created_at, model.tour_id, model.status, model.guests_count, model.total_price)
+        .where(model.created_at.isnot(None), model.status.isnot(None))
+        for model in (Order, OrderArchive)
+    )).subquery()
+    day = _order_day(orders.c.created_at)
+    bind.execute(delete(SalesDaily))
+    bind.execute(
+        insert(SalesDaily).from_select(
+            ['day', 'tour_id', 'status', 'orders_count', 'guests_count', 'revenue'],
+            select(day, orders.c.tour_id, orders.c.status, func.count(),
+                   func.coalesce(func.sum(orders.c.guests_count), 0),
+                   func.coalesce(func.sum(orders.c.total_price), 0))
+            .group_by(day, orders.c.tour_id, orders.c.status)
+        )
+    )
+    return bind.scalar(select(func.count()).select_from(SalesDaily))
+
+
+def parse_period(args):
+    """Период панели из query-string (date_from, date_to); по умолчанию — последний год"""
+    today = datetime.utcnow().date()
+    try:
+        date_to = datetime.strptime(args['date_to'], '%Y-%m-%d').date() if args.get('date_to') else today
+        date_from = (datetime.strptime(args['date_from'], '%Y-%m-%d').date() if args.get('date_from')
+                     else date_to - timedelta(days=DEFAULT_PERIOD_DAYS))
+    except ValueError:
+        date_to, date_from = today, today - timedelta(days=DEFAULT_PERIOD_DAYS)
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    return date_from, date_to
+
+
+def _sum_if(column, condition):
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+
+def load_dashboard(date_from, date_to, top_tours=20):
+    """Данные панели аналитики за период. Читает только витрину и заезды"""
+    in_period = SalesDaily.day.between(date_from, date_to)
+    booked = SalesDaily.status != CANCELLED_STATUS
+    paid = SalesDaily.status.in_(REVENUE_STATUSES)
+
+    by_status = {status: {'orders': 0, 'guests': 0, 'revenue': 0.0} for status in ORDER_STATUSES}
+    for status, orders, guests, revenue in db.session.execute(
+        select(SalesDaily.status, func.sum(SalesDaily.orders_count),
+               func.sum(SalesDaily.guests_count), func.sum(SalesDaily.revenue))
+        .where(in_period).group_by(SalesDaily.status)
+    ):
+        by_status[status] = {'orders': orders or 0, 'guests': guests or 0, 'revenue': revenue or 0.0}
+
+    revenue = _sum_if(SalesDaily.revenue, paid)
+    tours = db.session.execute(
+        select(SalesDaily.tour_id, Tour.name,
+               _sum_if(SalesDaily.orders_count, booked).label('orders'),
+               _sum_if(SalesDaily.guests_count, booked).label('guests'),
+               revenue.label('revenue'),
+               _sum_if(SalesDaily.orders_count, SalesDaily.status == CANCELLED_STATUS).label('cancelled'))
+        .outerjoin(Tour, Tour.id == SalesDaily.tour_id)
+        .where(in_period)
+        .group_by(SalesDaily.tour_id, Tour.name)
+        .order_by(revenue.desc(), SalesDaily.tour_id)
+        .limit(top_tours)
+    ).all()
+
+    # По дням суммирует база, по месяцам — Python: строк не больше, чем дней в периоде
+    months = OrderedDict()
+    for day, orders, guests, day_revenue in db.session.execute(
+        select(SalesDaily.day,
+               _sum_if(SalesDaily.orders_count, booked), _sum_if(SalesDaily.guests_count, booked),
+               _sum_if(SalesDaily.revenue, paid))
+        .where(in_period).group_by(SalesDaily.day).order_by(SalesDaily.day)
+    ):
+        month = months.setdefault(day.strftime('%Y-%m'), {'orders': 0, 'guests': 0, 'revenue': 0.0})
+        month['orders'] += orders
+        month['guests'] += guests
+        month['revenue'] += day_revenue
+
+    occupancy = db.session.execute(
+        select(Tour.id, Tour.name, func.count(Departure.id).label('departures'),
+               func.sum(Departure.seats_booked).label('seats_booked'),
+               func.sum(Departure.capacity).label('capacity'))
+        .join(Tour, Tour.id == Departure.tour_id)
+        .where(Departure.start_date >= date.today())
+        .group_by(Tour.id, Tour.name)
+        .order_by(Tour.name)
+    ).all()
+
+    return {
+        'by_status': by_status,
+        'totals': {
+            'orders': sum(v['orders'] for s, v in by_status.items() if s != CANCELLED_STATUS),
+            'guests': sum(v['guests'] for s, v in by_status.items() if s != CANCELLED_STATUS),
+            'revenue': sum(v['revenue'] for s, v in by_status.items() if s in REVENUE_STATUSES),
+            'cancelled': by_status[CANCELLED_STATUS]['orders'],
+        },
+        'tours': tours,
+        'months': months,
+        'occupancy': occupancy,
+    }
@@ -0,0 +1,12 @@
+"""Точка входа для ASGI-сервера.
+
+    ASYNC_MODE=1 uvicorn asgi:application --workers 4
+
+Flask работает как WSGI-приложение в пуле потоков сервера, а страницы
+из async_views.py при ASYNC_MODE=1 ждут базу в общем цикле событий
+(см. async_db.py). Зависимости — requirements-async.txt.
+"""
+from asgiref.wsgi import WsgiToAsgi
+from app import app
+
+application = WsgiToAsgi(app)
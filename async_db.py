@@ -0,0 +1,144 @@
+import asyncio
+import os
+import ssl
+import threading
+from config.database import REPLICA_BIND, _env_bool, _is_local, use_replica
+
+
+def async_url(url):
+    """Адрес базы для асинхронного драйвера: pg8000 → asyncpg, sqlite → aiosqlite"""
+    for prefix in ('postgresql+pg8000://', 'postgresql://'):
+        if url.startswith(prefix):
+            return 'postgresql+asyncpg://' + url[len(prefix):]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к базе для обработчиков, которые в основном ждут её.
+
+    Flask остаётся WSGI-приложением, а асинхронные обработчики (см.
+    async_views.py) выполняются в цикле событий, который asgiref создаёт
+    на каждый запрос. Соединения asyncpg привязаны к циклу, в котором
+    открыты, поэтому движок и пул живут в одном постоянном цикле в
+    отдельном потоке процесса, а обработчики отправляют туда запросы и
+    ждут результат. Независимые запросы страницы идут одновременно по
+    разным соединениям: страница ждёт одну задержку до базы, а не сумму.
+
+    Загрузчик — корутинная функция от AsyncSession. Он выполняется в
+    чужом потоке, поэтому не должен трогать контекст Flask, а связи
+    моделей должны быть загружены заранее (joinedload/contains_eager).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.url = None
+        self.replica_url = None
+        self.pool_size = 10
+        self.statement_timeout = None
+        self._loop = None
+        self._pid = None
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ASYNC_MODE', self.enabled)
+        self.url = app.config.get('ASYNC_DATABASE_URL') or async_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        replica = (app.config.get('SQLALCHEMY_BINDS') or {}).get(REPLICA_BIND)
+        if replica:
+            self.replica_url = app.config.get('ASYNC_DATABASE_REPLICA_URL') or async_url(replica['url'])
+        self.pool_size = app.config.get('ASYNC_POOL_SIZE', self.pool_size)
+        self.statement_timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+        app.extensions['async_db'] = self
+
+    def _engine_options(self, url):
+        if url.startswith('sqlite'):
+            return {}
+        options = {
+            'pool_size': self.pool_size,
+            'max_overflow': self.pool_size,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True,
+        }
+        if url.startswith('postgresql+asyncpg'):
+            connect_args = {}
+            if _env_bool('DB_SSL', not _is_local(url)):
+                connect_args['ssl'] = ssl.create_default_context()
+            if self.statement_timeout:
+                connect_args['server_settings'] = {'statement_timeout': str(int(self.statement_timeout))}
+            options['connect_args'] = connect_args
+        return options
+
+    def _ensure_loop(self):
+        # После fork воркера поток цикла родителя в процессе не существует
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._engines = {}
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop.run_forever, name='async-db', daemon=True).start()
+            return self._loop
+
+    def _engine(self, replica):
+        # Вызывается только в потоке цикла, поэтому без блокировки
+        key = 'replica' if replica else 'primary'
+        if key not in self._engines:
+            try:
+                from sqlalchemy.ext.asyncio import create_async_engine
+            except ImportError as e:
+                raise RuntimeError('Для ASYNC_MODE установите зависимости из requirements-async.txt') from e
+            url = self.replica_url if replica else self.url
+            self._engines[key] = create_async_engine(url, **self._engine_options(url))
+        return self._engines[key]
+
+    async def _call(self, loader, replica):
+        from sqlalchemy.ext.asyncio import AsyncSession
+        async with AsyncSession(self._engine(replica), expire_on_commit=False) as session:
+            return await loader(session)
+
+    async def run(self, loader, primary=False):
+        """Выполняет загрузчик в цикле базы и возвращает его результат.
+
+        В read_only-обработчиках чтение идёт с реплики, если она настроена
+        и клиент недавно ничего не записывал; primary=True — всегда с
+        основной базы.
+        """
+        replica = not primary and self.replica_url is not None and use_replica()
+        future = asyncio.run_coroutine_threadsafe(self._call(loader, replica), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    async def scalar(self, statement, primary=False):
+        return await self.run(lambda session: session.scalar(statement), primary)
+
+    async def scalars(self, statement, primary=False):
+        async def load(session):
+            return (await session.scalars(statement)).all()
+        return await self.run(load, primary)
+
+    async def all(self, statement, primary=False):
+        async def load(session):
+            return (await session.execute(statement)).all()
+        return await self.run(load, primary)
+
+    def dispose(self):
+        """Закрывает пулы (для скриптов и замеров)"""
+        with self._lock:
+            loop, engines = self._loop, list(self._engines.values())
+            if loop is None or self._pid != os.getpid():
+                return
+            self._engines = {}
+
+        async def close():
+            for engine in engines:
+                await engine.dispose()
+        asyncio.run_coroutine_threadsafe(close(), loop).result()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'engines': {key: engine.pool.status() for key, engine in self._engines.items()},
+        }
+
+
+adb = AsyncDatabase()
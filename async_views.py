@@ -0,0 +1,180 @@
+"""Асинхронные версии страниц, которые в основном ждут базу.
+
+Включаются переменной ASYNC_MODE=1 (нужны пакеты из requirements-async.txt):
+init_app подменяет обработчики index, tour_detail, my_orders и
+admin_orders, остальные маршруты остаются синхронными. Запросы к базе
+идут через async_db.adb, независимые — одновременно.
+"""
+import asyncio
+from flask import abort, current_app, flash, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+from async_db import adb
+from catalog import catalog, snapshot_tour
+from config import read_only
+from models import Tour, ORDER_STATUSES
+from order_archive import user_archive_count_statement, user_archive_statement
+from order_board import (STATUS_CHOICES, board_statuses, build_board, parse_order_filters,
+                         status_counts_statement, status_page_statement, tour_choices_statement)
+from order_summary import build_summary, summary_cache, summary_statement, user_orders_page, user_orders_statement
+from recommendations import (build_index, needed_tour_ids, popular_since, popular_statement, rank_popular,
+                             recommendation_index, similar_statement, similar_tours, tours_statement)
+from tour_search import (SORT_OPTIONS, cache_key, count_statement, destinations_statement, page_count,
+                         page_statement, parse_tour_filters, search_query, search_result)
+
+
+async def search_tours(filters):
+    """Страница каталога: COUNT и строки страницы одновременно"""
+    conditions, order_by = search_query(filters)
+    page = filters.get('page', 1)
+    total, rows = await asyncio.gather(
+        adb.scalar(count_statement(conditions)),
+        adb.all(page_statement(conditions, order_by, page)),
+    )
+    pages = page_count(total)
+    if page > pages:
+        # Страница за концом списка: как и синхронная версия, отдаём последнюю
+        page = pages
+        rows = await adb.all(page_statement(conditions, order_by, page))
+    return search_result(rows, total, page, pages)
+
+
+async def load_destinations():
+    return [destination for destination, in await adb.all(destinations_statement())]
+
+
+async def load_tour_snapshot(tour_id):
+    async def load(session):
+        tour = await session.get(Tour, tour_id)
+        return snapshot_tour(tour) if tour else None
+    return await adb.run(load)
+
+
+async def load_recommendations():
+    """Индекс рекомендаций: пары туров и популярные — одновременно, затем туры"""
+    similar_rows, popular_rows = await asyncio.gather(
+        adb.all(similar_statement()),
+        adb.all(popular_statement(popular_since())),
+    )
+    popular = rank_popular(popular_rows)
+    tour_ids = needed_tour_ids(similar_rows, popular)
+    tours = await adb.scalars(tours_statement(tour_ids)) if tour_ids else []
+    return build_index(similar_rows, popular, tours)
+
+
+async def load_summary(user_id):
+    summary = summary_cache.cached(user_id)
+    if summary is None:
+        # Как и в синхронной версии — с основной базы
+        summary = summary_cache.store(user_id, build_summary(await adb.all(summary_statement(user_id), primary=True)))
+    return summary
+
+
+@read_only
+async def index():
+    generation = recommendation_index.generation()
+    not_modified = catalog.not_modified(generation)
+    if not_modified:
+        return not_modified
+
+    is_admin = current_user.is_authenticated and current_user.is_admin()
+    filters = parse_tour_filters(request.args, is_admin=is_admin)
+    key = cache_key(filters)
+
+    try:
+        if key:
+            search = catalog.get_or_load_async(key, lambda: search_tours(filters))
+        else:
+            search = search_tours(filters)
+        result, destinations = await asyncio.gather(
+            search, catalog.get_or_load_async('destinations', load_destinations)
+        )
+        # Популярные туры — только на главной без фильтров
+        popular = ()
+        if not request.args:
+            popular = (await recommendation_index.get_async(load_recommendations))['popular']['bookings']
+    except Exception:
+        current_app.logger.exception('Ошибка при загрузке туров')
+        result = {'tours': [], 'total': 0, 'page': 1, 'pages': 1}
+        destinations = []
+        popular = ()
+
+    return catalog.conditional(render_template(
+        'index.html', tours=result['tours'], result=result, filters=filters,
+        destinations=destinations, sort_options=SORT_OPTIONS, popular=popular
+    ), generation)
+
+
+@read_only
+async def tour_detail(tour_id):
+    generation = recommendation_index.generation()
+    not_modified = catalog.not_modified(generation)
+    if not_modified:
+        return not_modified
+
+    tour, index = await asyncio.gather(
+        catalog.get_or_load_async(f'tour:{tour_id}', lambda: load_tour_snapshot(tour_id)),
+        recommendation_index.get_async(load_recommendations),
+    )
+    if tour is None:
+        abort(404)
+    similar, popular = similar_tours(index, tour_id)
+    return catalog.conditional(render_template('tour_detail.html', tour=tour, similar=similar, popular=popular),
+                               generation)
+
+
+@login_required
+@read_only
+async def my_orders():
+    page = request.args.get('page', 1, type=int)
+    archived = request.args.get('archived') == '1'
+    if archived:
+        summary, total = await asyncio.gather(load_summary(current_user.id),
+                                              adb.scalar(user_archive_count_statement(current_user.id)))
+        page, pages = user_orders_page(total, page)
+        orders = await adb.scalars(user_archive_statement(current_user.id, page))
+    else:
+        summary = await load_summary(current_user.id)
+        total = summary['total']
+        page, pages = user_orders_page(total, page)
+        orders = await adb.scalars(user_orders_statement(current_user.id, page))
+    result = {'orders': orders, 'total': total, 'page': page, 'pages': pages}
+    return render_template('my_orders.html', orders=orders, result=result, summary=summary, archived=archived)
+
+
+@login_required
+async def admin_orders():
+    if not current_user.is_admin():
+        flash('У вас нет прав для доступа к этой странице!', 'error')
+        return redirect(url_for('index'))
+
+    try:
+        filters = parse_order_filters(request.args)
+    except ValueError:
+        flash('Неверные параметры фильтра', 'error')
+        filters = {}
+
+    # Колонки, счётчики и список туров — одновременно, по своим соединениям
+    statuses = board_statuses(filters)
+    *columns, count_rows, tours = await asyncio.gather(
+        *(adb.scalars(status_page_statement(status, filters)) for status in statuses),
+        adb.all(status_counts_statement(filters)),
+        adb.all(tour_choices_statement()),
+    )
+    counts = dict.fromkeys(ORDER_STATUSES, 0)
+    counts.update(count_rows)
+    board, counts = build_board(filters, dict(zip(statuses, columns)), counts)
+    return render_template('admin_orders.html', board=board, counts=counts, filters=filters,
+                           tours=tours, statuses=ORDER_STATUSES, status_choices=STATUS_CHOICES)
+
+
+def init_app(app):
+    """Подменяет обработчики на асинхронные, если включён ASYNC_MODE.
+
+    Вызывается после регистрации маршрутов: URL и имена эндпоинтов
+    остаются прежними, поэтому url_for и шаблоны ничего не замечают.
+    """
+    adb.init_app(app)
+    if not adb.enabled:
+        return
+    for view in (index, tour_detail, my_orders, admin_orders):
+        app.view_functions[view.__name__] = view
@@ -0,0 +1,168 @@
+import calendar
+from datetime import date, datetime, timedelta
+from sqlalchemy import Date, and_, cast, func, literal, literal_column, select
+from sqlalchemy.orm import joinedload
+from booking import SEAT_HOLDING_STATUSES
+from models import db, Departure, Order, Tour
+
+# Самый длинный диапазон, который можно запросить за раз
+MAX_RANGE_DAYS = 366
+
+
+def parse_date_range(args, max_days=MAX_RANGE_DAYS):
+    """(date_from, date_to) из query-string, обе даты включительно.
+
+    При неверных датах или слишком длинном диапазоне — ValueError.
+    """
+    try:
+        date_from = datetime.strptime(args['date_from'], '%Y-%m-%d').date()
+        date_to = datetime.strptime(args.get('date_to') or args['date_from'], '%Y-%m-%d').date()
+    except (KeyError, ValueError) as e:
+        raise ValueError('Укажите date_from и date_to в формате ГГГГ-ММ-ДД') from e
+    if date_to < date_from:
+        raise ValueError('date_to раньше date_from')
+    if (date_to - date_from).days >= max_days:
+        raise ValueError(f'Диапазон не длиннее {max_days} дней')
+    return date_from, date_to
+
+
+def month_bounds(value=None):
+    """Первый и последний день месяца 'ГГГГ-ММ' (по умолчанию — текущего)"""
+    if value:
+        try:
+            first = datetime.strptime(value, '%Y-%m').date()
+        except ValueError as e:
+            raise ValueError('Месяц указывается в формате ГГГГ-ММ') from e
+    else:
+        first = date.today().replace(day=1)
+    return first, first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+
+def _days(first, last):
+    """Рекурсивное CTE со всеми днями от first до last включительно"""
+    if db.engine.dialect.name == 'sqlite':
+        # В SQLite даты — строки ГГГГ-ММ-ДД, а CAST AS DATE превратил бы их в число
+        start = func.date(first.isoformat(), type_=Date)
+        days = select(start.label('day')).cte('days', recursive=True)
+        next_day = func.date(days.c.day, '+1 day')
+    else:
+        days = select(cast(literal(first, Date), Date).label('day')).cte('days', recursive=True)
+        next_day = cast(days.c.day + 1, Date)
+    return days.union_all(select(next_day).where(days.c.day < last))
+
+
+def stay_overlaps(date_from, date_to):
+    """Условие: поездка по заказу пересекается с днями date_from..date_to.
+
+    Заказ занимает дни [start_date, end_date). На PostgreSQL условие
+    записано через daterange, чтобы работал GiST-индекс ix_order_stay,
+    на остальных СУБД — двумя сравнениями по B-tree (start_date, end_date).
+    """
+    if db.engine.dialect.name == 'postgresql':
+        stay = func.daterange(Order.start_date, Order.end_date)
+        return stay.op('&&')(func.daterange(date_from, date_to, literal_column("'[]'")))
+    return and_(Order.start_date <= date_to, Order.end_date > date_from)
+
+
+def overlapping_orders(date_from, date_to, tour_id=None, limit=500):
+    """Заказы, занимающие места в какие-то из дней диапазона, вместе с турами и клиентами"""
+    statement = (
+        select(Order)
+        .options(joinedload(Order.tour, innerjoin=True), joinedload(Order.user, innerjoin=True))
+        .where(stay_overlaps(date_from, date_to), Order.status.in_(SEAT_HOLDING_STATUSES))
+        .order_by(Order.start_date, Order.id)
+        .limit(limit)
+    )
+    if tour_id is not None:
+        statement = statement.where(Order.tour_id == tour_id)
+    return db.session.scalars(statement).all()
+
+
+def available_tours(date_from, date_to, guests=1):
+    """Туры, в которые можно заехать с date_from по date_to на guests мест.
+
+    Строка заезда появляется при первом бронировании, поэтому день без
+    неё свободен целиком. Тур недоступен, только если на каждый день
+    диапазона есть заезд без нужного числа мест. Один запрос:
+    [(Tour, число дней, в которые можно заехать)].
+    """
+    days = (date_to - date_from).days + 1
+    full = and_(Departure.tour_id == Tour.id,
+                Departure.start_date.between(date_from, date_to),
+                Departure.capacity - Departure.seats_booked < guests)
+    full_days = func.count(Departure.id)
+    rows = db.session.execute(
+        select(Tour, days - full_days)
+        .outerjoin(Departure, full)
+        .where(Tour.is_active.is_(True), Tour.capacity >= guests)
+        .group_by(Tour.id)
+        .having(full_days < days)
+        .order_by(Tour.name)
+    ).all()
+    return [(tour, free_days) for tour, free_days in rows]
+
+
+def tour_calendar(tour, first, last):
+    """Свободные места тура на каждый день first..last одним запросом"""
+    days = _days(first, last)
+    seats_left = func.coalesce(Departure.capacity - Departure.seats_booked, tour.capacity)
+    rows = db.session.execute(
+        select(days.c.day, seats_left, Departure.id.is_not(None))
+        .select_from(days)
+        .outerjoin(Departure, and_(Departure.tour_id == tour.id, Departure.start_date == days.c.day))
+        .order_by(days.c.day)
+    ).all()
+    return [{'day': day, 'seats_left': max(seats, 0), 'has_departure': bool(has_departure)}
+            for day, seats, has_departure in rows]
+
+
+def occupancy_by_day(first, last, tour_id=None):
+    """Загрузка по дням first..last одним запросом.
+
+    Для каждого дня: сколько заказов и гостей в поездке, сколько заездов
+    начинается и сколько мест в них занято из скольких.
+    """
+    days = _days(first, last)
+    on_trip = [Order.start_date <= days.c.day, Order.end_date > days.c.day,
+               Order.status.in_(SEAT_HOLDING_STATUSES)]
+    starting = [Departure.start_date == days.c.day]
+    if tour_id is not None:
+        on_trip.append(Order.tour_id == tour_id)
+        starting.append(Departure.tour_id == tour_id)
+
+    def subquery(column, conditions):
+        return select(column).where(*conditions).scalar_subquery()
+
+    rows = db.session.execute(
+        select(
+            days.c.day,
+            subquery(func.count(Order.id), on_trip),
+            subquery(func.coalesce(func.sum(Order.guests_count), 0), on_trip),
+            subquery(func.count(Departure.id), starting),
+            subquery(func.coalesce(func.sum(Departure.seats_booked), 0), starting),
+            subquery(func.coalesce(func.sum(Departure.capacity), 0), starting),
+        ).order_by(days.c.day)
+    ).all()
+    return [{
+        'day': day,
+        'orders': orders,
+        'guests': guests,
+        'departures': departures,
+        'seats_booked': booked,
+        'capacity': capacity,
+        'load': round(booked / capacity, 3) if capacity else None,
+    } for day, orders, guests, departures, booked, capacity in rows]
+
+
+def month_weeks(first, days):
+    """Строки календаря по неделям (пн–вс) с None на месте чужих дней"""
+    cells = [None] * first.weekday() + list(days)
+    cells += [None] * (-len(cells) % 7)
+    return [cells[i:i + 7] for i in range(0, len(cells), 7)]
+
+
+def adjacent_months(first):
+    """'ГГГГ-ММ' предыдущего и следующего месяца"""
+    previous = (first - timedelta(days=1)).replace(day=1)
+    following = (first + timedelta(days=32)).replace(day=1)
+    return previous.strftime('%Y-%m'), following.strftime('%Y-%m')
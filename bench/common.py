@@ -0,0 +1,46 @@
+"""Общие помощники скриптов bench: база для замеров, перцентили, вывод."""
+import json
+import os
+import sys
+import tempfile
+from urllib.parse import urlsplit
+
+# Пароль всех пользователей, которых создаёт bench.seed
+BENCH_PASSWORD = 'bench-password'
+BENCH_ADMIN = 'bench_admin'
+
+
+def use_bench_database(allow_remote=False):
+    """Выбирает базу для замеров до импорта app.
+
+    Без DATABASE_URL это файл SQLite во временном каталоге. Удалённые
+    базы (в том числе боевая, если её адрес остался в окружении)
+    разрешены только с allow_remote, чтобы случайно не засеять их данными.
+    """
+    url = os.environ.setdefault(
+        'DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'tours_bench.db')
+    )
+    host = urlsplit(url).hostname
+    if not url.startswith('sqlite') and host not in ('localhost', '127.0.0.1', '::1') and not allow_remote:
+        sys.exit(f'Отказ: {host} — не локальная база. Добавьте --allow-remote, если это действительно нужно.')
+    # Фоновая рассылка уведомлений только мешает замерам
+    os.environ.setdefault('NOTIFY_WORKER', 'off')
+    # Пустая база замеров получает схему прямо при импорте app
+    os.environ.setdefault('SCHEMA_AUTO_MIGRATE', '1')
+    return url
+
+
+def percentile(sorted_values, share):
+    """Перцентиль по уже отсортированному списку (метод ближайшего ранга)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def print_result(result, as_json):
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for key, value in result.items():
+        print(f'{key:>20}: {value}')
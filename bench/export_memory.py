@@ -0,0 +1,173 @@
+"""Пиковая память процесса при выгрузке заказов на маленькой и большой базе.
+
+Запуск из корня проекта:
+
+    python -m bench.export_memory
+    python -m bench.export_memory --small 10000 --large 1000000 --format ndjson --json
+
+Скрипт заполняет временную SQLite-базу (или DATABASE_URL) синтетическими
+заказами и в отдельных процессах выгружает через /admin/orders/export
+сначала --small, потом --large заказов (фильтром по туру). Для каждого
+прогона печатается пиковый RSS дочернего процесса. Если на большой
+выборке пик вырос больше чем на --max-growth-mb, выгрузка держит строки
+в памяти, и скрипт завершается с кодом 1. --naive добавляет для
+сравнения прогон с Order.query.all().
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ADMIN_USERNAME = 'export_bench_admin'
+ADMIN_PASSWORD = 'export-bench-password'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--small', type=int, default=10000, help='заказов в малой выгрузке')
+    parser.add_argument('--large', type=int, default=300000, help='заказов в большой выгрузке')
+    parser.add_argument('--format', default='csv', choices=('csv', 'ndjson'))
+    parser.add_argument('--max-growth-mb', type=float, default=25.0)
+    parser.add_argument('--naive', action='store_true', help='сравнить с Order.query.all()')
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    # Служебные параметры дочернего процесса
+    parser.add_argument('--child', choices=('stream', 'naive'), help=argparse.SUPPRESS)
+    parser.add_argument('--tour-id', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def peak_rss_mb():
+    # ru_maxrss — килобайты на Linux и байты на macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def seed(counts):
+    """Создаёт по туру на каждый размер и заказы к ним; возвращает id туров"""
+    from sqlalchemy import insert, select
+    from app import app
+    from migrations import migrator
+    from models import db, Order, Tour, User
+
+    rng = random.Random(42)
+    statuses = ('Ожидание', 'Подтвержден', 'Завершен', 'Отменен')
+    with app.app_context():
+        migrator.upgrade()
+        admin = db.session.scalar(select(User).where(User.username == ADMIN_USERNAME))
+        if admin is None:
+            admin = User(username=ADMIN_USERNAME, email=f'{ADMIN_USERNAME}@example.com', role='admin')
+            admin.set_password(ADMIN_PASSWORD)
+            db.session.add(admin)
+            db.session.flush()
+
+        tour_ids = []
+        for count in counts:
+            tour = Tour(name=f'Выгрузка {count} {int(time.time())}', description='Синтетические заказы',
+                        price=100.0, duration_days=7, destination='Тест', capacity=count)
+            db.session.add(tour)
+            db.session.flush()
+            tour_ids.append(tour.id)
+
+            created = datetime.utcnow() - timedelta(days=365)
+            batch = []
+            for i in range(count):
+                guests = rng.randint(1, 4)
+                start = date.today() + timedelta(days=rng.randint(1, 300))
+                batch.append({
+                    'user_id': admin.id, 'tour_id': tour.id, 'guests_count': guests,
+                    'total_price': 100.0 * guests, 'start_date': start, 'end_date': start + timedelta(days=7),
+                    'contact_phone': '+70000000000', 'contact_email': f'client{i}@example.com',
+                    'special_requests': 'Синтетический заказ для проверки выгрузки' if i % 5 == 0 else None,
+                    'status': rng.choice(statuses), 'created_at': created + timedelta(seconds=i),
+                    'updated_at': created + timedelta(seconds=i),
+                })
+                if len(batch) == 10000:
+                    db.session.execute(insert(Order), batch)
+                    batch = []
+            if batch:
+                db.session.execute(insert(Order), batch)
+        db.session.commit()
+    return tour_ids
+
+
+def child(args):
+    """Выгрузка в дочернем процессе: печатает JSON с байтами, временем и пиком RSS"""
+    from app import app
+    started = time.perf_counter()
+    written = 0
+
+    if args.child == 'stream':
+        client = app.test_client()
+        client.post('/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+        response = client.get(f'/admin/orders/export?format={args.format}&tour_id={args.tour_id}',
+                              buffered=False)
+        assert response.status_code == 200, response.status_code
+        for chunk in response.response:
+            written += len(chunk)
+        response.close()
+    else:
+        from models import Order
+        with app.app_context():
+            orders = Order.query.filter_by(tour_id=args.tour_id).all()
+            for order in orders:
+                written += len(f'{order.id},{order.user.username},{order.tour.name},{order.total_price}\n')
+
+    print(json.dumps({
+        'bytes': written,
+        'seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def run_child(args, mode, tour_id):
+    command = [sys.executable, '-m', 'bench.export_memory', '--child', mode,
+               '--tour-id', str(tour_id), '--format', args.format]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault(
+        'DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'tours_export_memory.db')
+    )
+    os.environ.setdefault('NOTIFY_WORKER', 'off')
+
+    if args.child:
+        child(args)
+        return
+
+    started = time.perf_counter()
+    small_tour, large_tour = seed((args.small, args.large))
+    seed_seconds = round(time.perf_counter() - started, 1)
+
+    result = {
+        'database': os.environ['DATABASE_URL'].split('@')[-1],
+        'format': args.format,
+        'seed_seconds': seed_seconds,
+        'small': {'orders': args.small, **run_child(args, 'stream', small_tour)},
+        'large': {'orders': args.large, **run_child(args, 'stream', large_tour)},
+    }
+    if args.naive:
+        result['naive_large'] = {'orders': args.large, **run_child(args, 'naive', large_tour)}
+    growth = result['large']['peak_rss_mb'] - result['small']['peak_rss_mb']
+    result['rss_growth_mb'] = round(growth, 1)
+    result['constant_memory'] = growth <= args.max_growth_mb
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for key, value in result.items():
+            print(f'{key:>16}: {value}')
+
+    sys.exit(0 if result['constant_memory'] else 1)
+
+
+if __name__ == '__main__':
+    main()
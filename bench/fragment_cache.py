@@ -0,0 +1,87 @@
+"""Время рендеринга каталога с кешем карточек и без него.
+
+Запуск из корня проекта:
+
+    python -m bench.fragment_cache
+    python -m bench.fragment_cache --sizes 1000 10000 --repeat 5 --json
+
+База данных не нужна: туры создаются в памяти как TourSnapshot.
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+
+from flask import render_template
+
+from app import app
+from catalog import TourSnapshot
+from fragments import fragments
+from tour_search import SORT_OPTIONS
+
+
+def make_tours(count):
+    now = datetime.utcnow()
+    description = 'Насыщенная программа с экскурсиями, трансфером и проживанием. ' * 8
+    return [
+        TourSnapshot(
+            id=i, name=f'Тур №{i}', description=description, price=1000.0 + i,
+            duration_days=3 + i % 12, destination='Париж, Франция',
+            image_url=f'https://images.example.com/{i}.jpg', image_digest=None,
+            created_at=now, updated_at=now, is_active=True,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def measure(tours, repeat, enabled):
+    fragments.enabled = enabled
+    fragments.clear()
+    timings = []
+    # Тот же контекст, что передаёт app.index: одна страница каталога без фильтров
+    context = {
+        'tours': tours, 'filters': {}, 'result': {'tours': tours, 'total': len(tours), 'page': 1, 'pages': 1},
+        'destinations': [], 'sort_options': SORT_OPTIONS, 'popular': [],
+    }
+    with app.test_request_context('/'):
+        # Первый проход прогревает кеш и компиляцию шаблонов
+        render_template('index.html', **context)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render_template('index.html', **context)
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        tours = make_tours(size)
+        without_cache = measure(tours, args.repeat, enabled=False)
+        with_cache = measure(tours, args.repeat, enabled=True)
+        results.append({
+            'tours': size,
+            'without_cache_ms': round(without_cache * 1000, 2),
+            'with_cache_ms': round(with_cache * 1000, 2),
+            'speedup': round(without_cache / with_cache, 2),
+        })
+    fragments.enabled = app.config['FRAGMENT_CACHE']
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'туров':>8} {'без кеша, мс':>14} {'с кешем, мс':>13} {'ускорение':>10}")
+    for row in results:
+        print(f"{row['tours']:>8} {row['without_cache_ms']:>14} {row['with_cache_ms']:>13} {row['speedup']:>9}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Самопроверка кеша картинок туров (images.py) без доступа в сеть.
+
+Запуск из корня проекта (нужен Pillow):
+
+    python -m bench.images
+    python -m bench.images --repeat 20 --json
+
+Картинки рисуются Pillow прямо в скрипте. Одна проходит через
+ImageStore.ingest() (как файл, загруженный администратором), другая
+скачивается fetch() с локального http.server на 127.0.0.1. Для обеих
+проверяется, что варианты лежат на диске с размерами из VARIANTS, что
+ответ /images/<хеш>/<вариант>.jpg — JPEG с Cache-Control immutable и что
+повторная загрузка тех же байтов даёт тот же хеш. Кеш вариантов пишется
+во временный каталог. При любой ошибке скрипт завершается с кодом 1.
+"""
+import argparse
+import functools
+import hashlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from bench.common import print_result, use_bench_database
+
+# Пропорции исходников нарочно не совпадают с вариантами:
+# card обрезается точно под размер, detail только вписывается
+SOURCES = {
+    'upload.jpg': ((3000, 1500), 'JPEG'),
+    'remote.png': ((1200, 1600), 'PNG'),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='сколько раз отрисовать варианты для замера')
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    return parser.parse_args()
+
+
+def draw(size, fmt):
+    """Градиент с полупрозрачным углом для PNG: на нём видно обрезку и фон"""
+    from PIL import Image, ImageDraw
+    width, height = size
+    mode = 'RGBA' if fmt == 'PNG' else 'RGB'
+    image = Image.new(mode, size)
+    pen = ImageDraw.Draw(image)
+    for x in range(0, width, 10):
+        pen.rectangle((x, 0, x + 9, height), fill=(x * 255 // width, 120, 255 - x * 255 // width, 255))
+    if mode == 'RGBA':
+        pen.rectangle((0, 0, width // 4, height // 4), fill=(0, 0, 0, 0))
+    out = io.BytesIO()
+    image.save(out, fmt)
+    return out.getvalue()
+
+
+def expected_size(source_size, variant):
+    from images import VARIANTS
+    width, height, crop = VARIANTS[variant]
+    if crop:
+        return width, height
+    # thumbnail() сохраняет пропорции и не увеличивает картинку
+    scale = min(width / source_size[0], height / source_size[1], 1)
+    return round(source_size[0] * scale), round(source_size[1] * scale)
+
+
+def serve(directory):
+    """Локальный http.server с каталогом картинок; возвращает (сервер, базовый URL)"""
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    args = parse_args()
+    try:
+        from PIL import Image
+    except ImportError:
+        sys.exit('Нужен Pillow: pip install Pillow')
+
+    use_bench_database()
+    cache_dir = tempfile.mkdtemp(prefix='tours_images_')
+    os.environ['IMAGE_CACHE_DIR'] = cache_dir
+    os.environ['IMAGE_PIPELINE'] = '1'
+
+    from app import app
+    from images import ImageError, images, VARIANTS, variant_filename
+
+    problems = []
+
+    def check(condition, message):
+        if not condition:
+            problems.append(message)
+
+    served_dir = tempfile.mkdtemp(prefix='tours_images_src_')
+    data = {}
+    for name, (size, fmt) in SOURCES.items():
+        data[name] = draw(size, fmt)
+        with open(os.path.join(served_dir, name), 'wb') as f:
+            f.write(data[name])
+    with open(os.path.join(served_dir, 'broken.jpg'), 'wb') as f:
+        f.write(b'not an image')
+    server, base_url = serve(served_dir)
+
+    digests = {}
+    try:
+        started = time.perf_counter()
+        digests['upload.jpg'] = images.ingest(data['upload.jpg'])
+        ingest_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        digests['remote.png'] = images.fetch(f'{base_url}/remote.png')
+        fetch_ms = (time.perf_counter() - started) * 1000
+
+        for name, digest in digests.items():
+            check(digest == hashlib.sha256(data[name]).hexdigest(), f'{name}: хеш не совпадает с sha256 исходника')
+            check(os.path.exists(images.original_path(digest)), f'{name}: нет исходника на диске')
+            for variant in VARIANTS:
+                path = images.variant_path(digest, variant)
+                if not os.path.exists(path):
+                    problems.append(f'{name}: нет варианта {variant}')
+                    continue
+                with Image.open(path) as image:
+                    check(image.format == 'JPEG', f'{name}/{variant}: не JPEG, а {image.format}')
+                    check(image.size == expected_size(SOURCES[name][0], variant),
+                          f'{name}/{variant}: размер {image.size}, '
+                          f'ожидался {expected_size(SOURCES[name][0], variant)}')
+
+        check(images.ingest(data['upload.jpg']) == digests['upload.jpg'], 'повторный ingest дал другой хеш')
+        check(images.fetch(f'{base_url}/remote.png') == digests['remote.png'], 'повторный fetch дал другой хеш')
+
+        for url in (f'{base_url}/missing.jpg', f'{base_url}/broken.jpg', 'file:///etc/hostname'):
+            try:
+                images.fetch(url)
+                problems.append(f'{url}: ожидалась ImageError')
+            except ImageError:
+                pass
+
+        client = app.test_client()
+        for name, digest in digests.items():
+            for variant in VARIANTS:
+                response = client.get(f'/images/{digest}/{variant_filename(variant)}')
+                cache_control = response.headers.get('Cache-Control', '')
+                check(response.status_code == 200, f'{name}/{variant}: ответ {response.status_code}')
+                check(response.mimetype == 'image/jpeg', f'{name}/{variant}: тип {response.mimetype}')
+                check('immutable' in cache_control and 'public' in cache_control,
+                      f'{name}/{variant}: Cache-Control «{cache_control}»')
+        response = client.get(f'/images/{"0" * 64}/{variant_filename("card")}')
+        check(response.status_code == 404, f'неизвестный хеш: ответ {response.status_code}, ожидался 404')
+
+        # Скорость отрисовки вариантов из уже сохранённого исходника
+        timings = []
+        for _ in range(args.repeat):
+            for variant in VARIANTS:
+                os.unlink(images.variant_path(digests['upload.jpg'], variant))
+            started = time.perf_counter()
+            for variant in VARIANTS:
+                images.variant(digests['upload.jpg'], variant)
+            timings.append(time.perf_counter() - started)
+    except ImageError as e:
+        problems.append(f'ImageError: {e}')
+        ingest_ms = fetch_ms = 0
+        timings = [0]
+    finally:
+        server.shutdown()
+
+    print_result({
+        'cache_dir': cache_dir,
+        'ingest_ms': round(ingest_ms, 1),
+        'fetch_ms': round(fetch_ms, 1),
+        'render_variants_ms': round(statistics.median(timings) * 1000, 1),
+        'problems': problems or 'нет',
+    }, args.json)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
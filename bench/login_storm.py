@@ -0,0 +1,173 @@
+"""Пропускная способность входа и задержка остальных страниц во время волны входов.
+
+Запуск из корня проекта:
+
+    python -m bench.login_storm
+    python -m bench.login_storm --login-threads 16 --duration 15 --workers 2 4 --json
+
+Сценарии идут по очереди на одном приложении в этом процессе:
+
+* baseline — только читатели открывают главную и страницы туров;
+* inline-хеширование — к ним добавляются потоки, которые непрерывно
+  входят с верным паролем, а хеш считается прямо в обработчике;
+* пул из N процессов — то же, но через passwords.hasher;
+* перебор паролей — неверные пароли с одного IP при включённом
+  ограничении попыток: почти все запросы отсекаются ответом 429
+  ещё до хеширования.
+
+Для каждого сценария печатаются входы в секунду, доли ответов 429/503
+и p50/p99 страниц читателей. База — та же, что у bench.seed; если
+туров нет, создаётся несколько.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from bench.common import percentile, use_bench_database
+
+LOGIN_USER = 'bench_login'
+LOGIN_PASSWORD = 'bench-login-password'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--login-threads', type=int, default=8, help='потоков, которые входят')
+    parser.add_argument('--reader-threads', type=int, default=2, help='потоков, которые открывают страницы')
+    parser.add_argument('--duration', type=float, default=8, help='секунд на сценарий')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2], help='размеры пула хеширования')
+    parser.add_argument('--allow-remote', action='store_true', help='разрешить нелокальную базу')
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    return parser.parse_args()
+
+
+def prepare(app):
+    from sqlalchemy import select
+    from migrations import migrator
+    from models import db, Tour, User
+
+    with app.app_context():
+        migrator.upgrade()
+        user = User.query.filter_by(username=LOGIN_USER).first()
+        if user is None:
+            user = User(username=LOGIN_USER, email=f'{LOGIN_USER}@example.com')
+            db.session.add(user)
+        # Хеш с текущими параметрами, чтобы вход не уходил в пересчёт
+        user.set_password(LOGIN_PASSWORD)
+        if Tour.query.count() == 0:
+            for i in range(20):
+                db.session.add(Tour(name=f'Тур для замера входа №{i}', description='Описание тура',
+                                    price=1000 + i, duration_days=5, destination='Сочи, Россия'))
+        db.session.commit()
+        return db.session.scalars(select(Tour.id).where(Tour.is_active.is_(True)).limit(50)).all()
+
+
+def run_scenario(app, tour_ids, login_threads, reader_threads, duration, password=None):
+    """Гоняет читателей и (если login_threads) входящих; возвращает метрики"""
+    stop = threading.Event()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def reader(offset):
+        client = app.test_client()
+        paths = ['/'] + [f'/tour/{tour_id}' for tour_id in tour_ids]
+        i = offset
+        local = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get(paths[i % len(paths)])
+            local.append((time.perf_counter() - started) * 1000)
+            i += 1
+        with lock:
+            latencies.extend(local)
+
+    def login():
+        # Без cookies: иначе после первого входа /login просто перенаправляет
+        client = app.test_client(use_cookies=False)
+        local = {}
+        while not stop.is_set():
+            response = client.post('/login', data={'username': LOGIN_USER, 'password': password})
+            local[response.status_code] = local.get(response.status_code, 0) + 1
+        with lock:
+            for code, count in local.items():
+                statuses[code] = statuses.get(code, 0) + count
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(reader_threads)]
+    threads += [threading.Thread(target=login) for _ in range(login_threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    attempts = sum(statuses.values())
+    # Успешный вход отвечает редиректом, неверный пароль — страницей 200
+    logins = statuses.get(302, 0) if password == LOGIN_PASSWORD else statuses.get(200, 0)
+    return {
+        'login_attempts_per_s': round(attempts / elapsed, 1),
+        'logins_per_s': round(logins / elapsed, 1),
+        'rejected_429': statuses.get(429, 0),
+        'busy_503': statuses.get(503, 0),
+        'pages': len(latencies),
+        'page_p50_ms': round(percentile(latencies, 0.5), 1),
+        'page_p99_ms': round(percentile(latencies, 0.99), 1),
+    }
+
+
+def main():
+    args = parse_args()
+    use_bench_database(args.allow_remote)
+    # Во время волны медленными будут все входы — лог только мешает
+    os.environ.setdefault('PROFILE_SLOW_MS', '600000')
+
+    from app import app
+    from login_throttle import login_throttle
+    from passwords import hasher
+
+    configured = hasher.workers
+    hasher.workers = 0
+    # Пользователь создаётся с хешем, посчитанным на месте
+    tour_ids = prepare(app)
+    ip_limit, user_limit = login_throttle.ip_limit, login_throttle.user_limit
+    # Все потоки приходят с одного адреса: для замера пропускной
+    # способности ограничение выключено, для перебора — включено
+    login_throttle.ip_limit = login_throttle.user_limit = 0
+
+    results = {}
+    results['baseline'] = run_scenario(app, tour_ids, 0, args.reader_threads, args.duration)
+    results['inline'] = run_scenario(app, tour_ids, args.login_threads, args.reader_threads,
+                                     args.duration, LOGIN_PASSWORD)
+    for workers in args.workers:
+        hasher.shutdown()
+        hasher.workers = workers
+        hasher.max_pending = workers * 5
+        # Первый вызов поднимает процессы пула — это не должно попасть в замер
+        hasher.verify(hasher.hash('warmup'), 'warmup')
+        results[f'pool_{workers}'] = run_scenario(app, tour_ids, args.login_threads, args.reader_threads,
+                                                  args.duration, LOGIN_PASSWORD)
+
+    login_throttle.ip_limit, login_throttle.user_limit = ip_limit, user_limit
+    results['stuffing'] = run_scenario(app, tour_ids, args.login_threads, args.reader_threads,
+                                       args.duration, 'wrong-password')
+    hasher.shutdown()
+    hasher.workers = configured
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'сценарий':>10} {'попыток/с':>10} {'входов/с':>9} {'429':>7} {'503':>6} "
+          f"{'страниц':>8} {'p50, мс':>8} {'p99, мс':>8}")
+    for name, row in results.items():
+        print(f"{name:>10} {row['login_attempts_per_s']:>10} {row['logins_per_s']:>9} {row['rejected_429']:>7} "
+              f"{row['busy_503']:>6} {row['pages']:>8} {row['page_p50_ms']:>8} {row['page_p99_ms']:>8}")
+
+
+if __name__ == '__main__':
+    main()
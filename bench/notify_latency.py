@@ -0,0 +1,144 @@
+"""Время смены статуса заказа при быстром и медленном почтовом сервере.
+
+Запуск из корня проекта:
+
+    python -m bench.notify_latency
+    python -m bench.notify_latency --updates 200 --delay 1.0 --json
+
+Скрипт поднимает smtp-sink, создаёт тур, пользователя и заказы во
+временной SQLite-базе (или в DATABASE_URL), затем администратор меняет
+статусы заказов через тестовый клиент Flask — сначала при мгновенном
+SMTP, потом при SMTP, отвечающем на каждое письмо с задержкой --delay.
+Письма уходят фоновым воркером, поэтому задержки ответа в обоих
+прогонах должны совпадать. В конце скрипт ждёт, пока outbox опустеет,
+и проверяет, что все письма дошли (иначе код выхода 1).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=100, help='смен статуса в каждом прогоне')
+    parser.add_argument('--delay', type=float, default=0.5, help='задержка медленного SMTP, сек')
+    parser.add_argument('--fail-rate', type=float, default=0.1, help='доля писем с временной ошибкой')
+    parser.add_argument('--timeout', type=float, default=120, help='сколько ждать опустошения outbox')
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    return parser.parse_args()
+
+
+def percentile(values, share):
+    return values[max(int(len(values) * share) - 1, 0)]
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault(
+        'DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'tours_notify_latency.db')
+    )
+    # Повторы без ожидания, чтобы проверка не растягивалась на минуты
+    os.environ.setdefault('NOTIFY_RETRY_BASE', '0')
+    os.environ.setdefault('NOTIFY_POLL_INTERVAL', '0.2')
+
+    from bench.smtp_sink import SMTPSink
+    sink = SMTPSink(('127.0.0.1', 0), fail_rate=args.fail_rate).start()
+    os.environ['SMTP_URL'] = f'smtp://127.0.0.1:{sink.port}'
+
+    # Импорт после настройки окружения: app читает его при загрузке
+    from sqlalchemy import select
+    from app import app
+    from migrations import migrator
+    from models import db, Notification, Order, Tour, User
+
+    run_id = str(int(time.time()))
+    username = f'notify_admin_{run_id}'
+    password = 'bench-password'
+    orders_needed = args.updates * 2
+
+    with app.app_context():
+        migrator.upgrade()
+        tour = Tour(name=f'Тур уведомлений {run_id}', description='Тур для проверки уведомлений',
+                    price=100.0, duration_days=3, destination='Тест', capacity=orders_needed)
+        admin = User(username=username, email=f'{username}@example.com', role='admin')
+        admin.set_password(password)
+        db.session.add_all([tour, admin])
+        db.session.flush()
+        start_date = date.today() + timedelta(days=30)
+        orders = [
+            Order(user_id=admin.id, tour_id=tour.id, guests_count=1, total_price=100.0,
+                  start_date=start_date, end_date=start_date + timedelta(days=3),
+                  contact_phone='+70000000000', contact_email=f'client{i}@example.com')
+            for i in range(orders_needed)
+        ]
+        db.session.add_all(orders)
+        db.session.commit()
+        order_ids = [order.id for order in orders]
+        first_notification = db.session.scalar(select(db.func.coalesce(db.func.max(Notification.id), 0)))
+
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': password})
+
+    def run(ids, delay):
+        sink.delay = delay
+        latencies = []
+        for order_id in ids:
+            started = time.perf_counter()
+            response = client.post(f'/order/{order_id}/update-status', data={'status': 'Подтвержден'})
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 302, response.status_code
+        latencies.sort()
+        return {
+            'smtp_delay_seconds': delay,
+            'latency_p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'latency_max_ms': round(latencies[-1] * 1000, 2),
+        }
+
+    fast = run(order_ids[:args.updates], 0.0)
+    slow = run(order_ids[args.updates:], args.delay)
+
+    # Ждём, пока воркер разошлёт всё, включая повторы после ошибок 451
+    deadline = time.monotonic() + args.timeout
+    with app.app_context():
+        while True:
+            pending = db.session.scalar(
+                select(db.func.count(Notification.id))
+                .where(Notification.id > first_notification, Notification.status == 'pending')
+            )
+            db.session.rollback()
+            if not pending or time.monotonic() > deadline:
+                break
+            time.sleep(0.2)
+        sent = db.session.scalar(
+            select(db.func.count(Notification.id))
+            .where(Notification.id > first_notification, Notification.status == 'sent')
+        )
+
+    result = {
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'fast_smtp': fast,
+        'slow_smtp': slow,
+        'notifications_expected': orders_needed,
+        'notifications_sent': sent,
+        'notifications_pending': pending,
+        'smtp_accepted': len(sink.messages),
+        'smtp_rejected': sink.rejected,
+    }
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for key, value in result.items():
+            print(f'{key:>24}: {value}')
+
+    sys.exit(0 if sent == orders_needed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Скорость расчёта цен: таблицы цен туров против запросов к базе на каждую цену.
+
+Запуск из корня проекта (после bench.seed):
+
+    python -m bench.pricing
+    python -m bench.pricing --quotes 200000 --batch 1000 --naive 5000 --json
+
+К турам базы добавляются синтетические правила: общие (лето дороже,
+надбавка в выходные, групповые скидки) и по одному сезону на каждый
+тур. Правила живут только в транзакции замера и откатываются в конце,
+таблицы цен строятся в памяти процесса, а не в общем кеше.
+
+Замеры: сборка таблиц всех туров с нуля, пачки quote_many (как API
+/api/quotes и календари), одиночные quote (как бронирование) и
+наивный расчёт, который читает тур и правила из базы для каждой цены.
+Наивные цены сверяются с табличными.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from bench.common import print_result, use_bench_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quotes', type=int, default=100000, help='цен в замере quote_many')
+    parser.add_argument('--batch', type=int, default=500, help='цен в одном вызове quote_many')
+    parser.add_argument('--single', type=int, default=20000, help='цен в замере одиночных quote')
+    parser.add_argument('--naive', type=int, default=2000, help='цен в наивном замере')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--allow-remote', action='store_true', help='разрешить нелокальную базу')
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    return parser.parse_args()
+
+
+def add_rules(db, PriceRule, tour_ids, rng, today):
+    """Синтетические правила без коммита: замер их потом откатывает"""
+    year = today.year
+    rules = [
+        PriceRule(kind='season', name='Лето', date_from=date(year, 6, 1), date_to=date(year, 8, 31), percent=25),
+        PriceRule(kind='season', name='Лето', date_from=date(year + 1, 6, 1), date_to=date(year + 1, 8, 31),
+                  percent=25),
+        PriceRule(kind='surcharge', name='Выходные', weekdays='56', amount=300),
+        PriceRule(kind='surcharge', name='Новый год', date_from=date(year, 12, 28), date_to=date(year + 1, 1, 8),
+                  percent=40),
+        PriceRule(kind='group', name='Группа', min_guests=4, percent=-5),
+        PriceRule(kind='group', name='Большая группа', min_guests=6, percent=-10),
+    ]
+    for tour_id in tour_ids:
+        start = today + timedelta(days=rng.randint(0, 300))
+        rules.append(PriceRule(tour_id=tour_id, kind='season', name='Сезон тура', date_from=start,
+                               date_to=start + timedelta(days=rng.randint(7, 60)),
+                               percent=rng.choice((-15, -10, 10, 20, 30))))
+    db.session.add_all(rules)
+    db.session.flush()
+    return len(rules)
+
+
+def main():
+    args = parse_args()
+    use_bench_database(args.allow_remote)
+
+    from sqlalchemy import or_, select
+    from app import app
+    from cache import LocalBackend
+    from migrations import migrator
+    from models import db, PriceRule, Tour
+    from pricing import MAX_GUESTS, compile_table, price, pricing_engine
+
+    rng = random.Random(args.seed)
+    today = date.today()
+    # Таблицы с непроведёнными правилами не должны попасть в общий кеш (Redis)
+    pricing_engine.backend = LocalBackend()
+
+    with app.app_context():
+        migrator.upgrade()
+        tour_ids = db.session.scalars(select(Tour.id).where(Tour.is_active.is_(True))).all()
+        if not tour_ids:
+            raise SystemExit('В базе нет туров: сначала python -m bench.seed')
+        rules_added = add_rules(db, PriceRule, tour_ids, rng, today)
+
+        def random_items(count):
+            return [(rng.choice(tour_ids), today + timedelta(days=rng.randint(0, 364)), rng.randint(1, MAX_GUESTS))
+                    for _ in range(count)]
+
+        def naive_quote(tour_id, day, guests):
+            # Как было бы без таблиц: тур и его правила читаются из базы на каждую цену
+            base = db.session.scalar(select(Tour.price).where(Tour.id == tour_id))
+            rules = db.session.scalars(
+                select(PriceRule)
+                .where(or_(PriceRule.tour_id == tour_id, PriceRule.tour_id.is_(None)))
+                .order_by(PriceRule.id)
+            ).all()
+            rules = sorted(rules, key=lambda rule: rule.tour_id is not None)
+            return price(compile_table(tour_id, base, rules, day, 1), day, guests)
+
+        pricing_engine.clear()
+        started = time.perf_counter()
+        pricing_engine.tables(set(tour_ids))
+        compile_seconds = time.perf_counter() - started
+
+        items = random_items(args.quotes)
+        started = time.perf_counter()
+        quotes = []
+        for offset in range(0, len(items), args.batch):
+            quotes.extend(pricing_engine.quote_many(items[offset:offset + args.batch]))
+        batch_seconds = time.perf_counter() - started
+
+        single_items = items[:args.single]
+        started = time.perf_counter()
+        for tour_id, day, guests in single_items:
+            pricing_engine.quote(tour_id, day, guests)
+        single_seconds = time.perf_counter() - started
+
+        naive_items = items[:args.naive]
+        started = time.perf_counter()
+        naive = [naive_quote(*item) for item in naive_items]
+        naive_seconds = time.perf_counter() - started
+        mismatches = sum(1 for expected, quote in zip(naive, quotes) if expected.total != quote.total)
+
+        db.session.rollback()
+        pricing_engine.clear()
+
+    batch_rate = len(items) / batch_seconds
+    naive_rate = len(naive_items) / naive_seconds if naive_items else 0
+    print_result({
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'tours': len(tour_ids),
+        'rules': rules_added,
+        'horizon_days': pricing_engine.horizon,
+        'compile_ms': round(compile_seconds * 1000, 1),
+        'batch_size': args.batch,
+        'batch_quotes_per_s': round(batch_rate),
+        'single_quotes_per_s': round(len(single_items) / single_seconds) if single_items else None,
+        'naive_quotes_per_s': round(naive_rate) if naive_items else None,
+        'speedup_vs_naive': round(batch_rate / naive_rate, 1) if naive_rate else None,
+        'mismatches': mismatches,
+    }, args.json)
+
+
+if __name__ == '__main__':
+    main()
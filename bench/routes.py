@@ -0,0 +1,311 @@
+"""Замеры основных страниц: задержки, пропускная способность, число SQL-запросов.
+
+Запуск из корня проекта (база заполняется заранее через bench.seed):
+
+    python -m bench.routes
+    python -m bench.routes --requests 500 --routes index tour my_orders --output baseline.json
+    python -m bench.routes --compare baseline.json --threshold 0.2
+    python -m bench.routes --url http://127.0.0.1:8000 --threads 16 --requests 2000
+
+По умолчанию запросы идут через тестовый клиент Flask в этом же
+процессе, и для каждого маршрута считаются SQL-запросы на один ответ.
+С --url запросы идут по HTTP к запущенному серверу (gunicorn и т.п.)
+из --threads потоков; число SQL-запросов тогда неизвестно (null).
+Результат — JSON (--output или --json). С --compare скрипт сравнивает
+p95 и число запросов с сохранённым результатом и завершается с кодом 1,
+если какой-то маршрут стал медленнее больше чем на --threshold или
+начал делать больше SQL-запросов.
+
+Маршрут book создаёт настоящие заказы в базе замеров.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+from bench.common import BENCH_ADMIN, BENCH_PASSWORD, percentile, print_result, use_bench_database
+
+ROUTES = ('index', 'search', 'tour', 'my_orders', 'admin_orders', 'book', 'login')
+SEARCH_WORDS = ('Париж', 'пляжный', 'горный тур', 'экскурсии', 'Россия', 'семейный')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--requests', type=int, default=200, help='запросов на маршрут')
+    parser.add_argument('--warmup', type=int, default=10, help='запросов прогрева на маршрут')
+    parser.add_argument('--url', help='адрес запущенного сервера для замеров по HTTP')
+    parser.add_argument('--threads', type=int, default=8, help='потоков в режиме --url')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='сохранить результат в JSON-файл')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимый рост p95 (доля)')
+    parser.add_argument('--allow-remote', action='store_true', help='разрешить нелокальную базу')
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    return parser.parse_args()
+
+
+class Scenario:
+    """Данные для запросов: id туров, клиент с заказами, случайные параметры"""
+
+    def __init__(self, rng, tour_ids, customer, destinations):
+        self.rng = rng
+        self.tour_ids = tour_ids
+        self.customer = customer
+        self.destinations = destinations
+
+    def request(self, route):
+        """(метод, путь, данные формы, кто выполняет: anon/customer/admin/fresh)"""
+        rng = self.rng
+        if route == 'index':
+            query = {'page': rng.randint(1, 5), 'sort': rng.choice(('new', 'price', '-price'))}
+            if self.destinations and rng.random() < 0.3:
+                query['destination'] = rng.choice(self.destinations)
+            return 'GET', '/?' + urllib.parse.urlencode(query), None, 'anon'
+        if route == 'search':
+            return 'GET', '/?' + urllib.parse.urlencode({'q': rng.choice(SEARCH_WORDS)}), None, 'anon'
+        if route == 'tour':
+            return 'GET', f'/tour/{rng.choice(self.tour_ids)}', None, 'anon'
+        if route == 'my_orders':
+            return 'GET', '/my-orders', None, 'customer'
+        if route == 'admin_orders':
+            return 'GET', '/admin/orders', None, 'admin'
+        if route == 'book':
+            start = date.today() + timedelta(days=rng.randint(10, 200))
+            form = {'guests_count': rng.randint(1, 3), 'start_date': start.isoformat(),
+                    'contact_phone': '+79000000000', 'contact_email': 'bench@example.com'}
+            return 'POST', f'/book/{rng.choice(self.tour_ids)}', form, 'customer'
+        if route == 'login':
+            return 'POST', '/login', {'username': self.customer, 'password': BENCH_PASSWORD}, 'fresh'
+        raise ValueError(route)
+
+
+def load_scenario(app, rng):
+    from sqlalchemy import func, select
+    from models import db, Order, Tour, User
+
+    with app.app_context():
+        tour_ids = db.session.scalars(select(Tour.id).where(Tour.is_active.is_(True)).limit(5000)).all()
+        # Самый активный клиент: «Мои заказы» для него — худший случай
+        customer = db.session.scalar(
+            select(User.username).join(Order, Order.user_id == User.id)
+            .where(User.username.like('bench_%'))
+            .group_by(User.id, User.username).order_by(func.count(Order.id).desc()).limit(1)
+        )
+        destinations = db.session.scalars(select(Tour.destination).distinct().limit(50)).all()
+    if not tour_ids or customer is None:
+        sys.exit('В базе нет данных для замеров: сначала запустите python -m bench.seed')
+    return Scenario(rng, tour_ids, customer, destinations)
+
+
+def summarize(route, latencies, queries, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        'route': route,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'latency_mean_ms': ms(statistics.fmean(latencies)) if latencies else 0.0,
+        'latency_p50_ms': ms(percentile(latencies, 0.50)),
+        'latency_p95_ms': ms(percentile(latencies, 0.95)),
+        'latency_p99_ms': ms(percentile(latencies, 0.99)),
+        'latency_max_ms': ms(latencies[-1]) if latencies else 0.0,
+        'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def _ok(status):
+    # 409 — распроданный заезд при бронировании, это ожидаемый ответ
+    return status < 400 or status == 409
+
+
+def run_in_process(app, scenario, args):
+    from instrumentation import QueryCounter
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+
+    def login(client, username):
+        response = client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+        if response.status_code != 302:
+            sys.exit(f'Не удалось войти как {username}')
+
+    clients = {'anon': app.test_client(), 'customer': app.test_client(), 'admin': app.test_client()}
+    login(clients['customer'], scenario.customer)
+    login(clients['admin'], BENCH_ADMIN)
+
+    results = []
+    for route in args.routes:
+        latencies, queries, errors = [], [], 0
+        for i in range(args.warmup + args.requests):
+            method, path, form, who = scenario.request(route)
+            client = app.test_client() if who == 'fresh' else clients[who]
+            with QueryCounter(engine) as counter:
+                started = time.perf_counter()
+                response = client.open(path, method=method, data=form)
+                elapsed = time.perf_counter() - started
+            if i < args.warmup:
+                continue
+            latencies.append(elapsed)
+            queries.append(counter.count)
+            errors += not _ok(response.status_code)
+        results.append(summarize(route, latencies, queries, errors, sum(latencies)))
+    return results
+
+
+class HttpClient:
+    """Клиент с собственными cookie для режима --url"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+    def open(self, path, method='GET', data=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return 599
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Редирект после POST — это сам ответ, который мы замеряем
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_over_http(scenario, args):
+    results = []
+    for route in args.routes:
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+        per_thread = [args.requests // args.threads + (i < args.requests % args.threads) for i in range(args.threads)]
+
+        def worker(count, seed):
+            rng = random.Random(seed)
+            local = Scenario(rng, scenario.tour_ids, scenario.customer, scenario.destinations)
+            clients = {}
+            for who, username in (('customer', scenario.customer), ('admin', BENCH_ADMIN)):
+                clients[who] = HttpClient(args.url)
+                clients[who].open('/login', 'POST', {'username': username, 'password': BENCH_PASSWORD})
+            clients['anon'] = HttpClient(args.url)
+            for i in range(args.warmup + count):
+                method, path, form, who = local.request(route)
+                client = HttpClient(args.url) if who == 'fresh' else clients[who]
+                started = time.perf_counter()
+                status = client.open(path, method, form)
+                elapsed = time.perf_counter() - started
+                if i < args.warmup:
+                    continue
+                with lock:
+                    latencies.append(elapsed)
+                    errors[0] += not _ok(status)
+
+        threads = [threading.Thread(target=worker, args=(count, args.seed + i)) for i, count in enumerate(per_thread)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Пропускная способность — по времени всего прогона, включая прогрев потоков
+        results.append(summarize(route, latencies, [], errors[0], time.perf_counter() - started))
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Строки сравнения с прошлым прогоном и признак регрессии"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {row['route']: row for row in json.load(f)['routes']}
+
+    rows, regressed = [], False
+    for row in results:
+        before = baseline.get(row['route'])
+        if before is None:
+            continue
+        change = (row['latency_p95_ms'] / before['latency_p95_ms'] - 1) if before['latency_p95_ms'] else 0.0
+        more_queries = (row['queries_mean'] is not None and before.get('queries_mean') is not None
+                        # Небольшой рост допустим: book меняет данные между прогонами
+                        and row['queries_mean'] > before['queries_mean'] * (1 + threshold) + 0.5)
+        slower = change > threshold
+        regressed = regressed or slower or more_queries
+        rows.append({
+            'route': row['route'],
+            'p95_before_ms': before['latency_p95_ms'],
+            'p95_after_ms': row['latency_p95_ms'],
+            'p95_change': f'{change:+.1%}',
+            'queries_before': before.get('queries_mean'),
+            'queries_after': row['queries_mean'],
+            'regression': slower or more_queries,
+        })
+    return rows, regressed
+
+
+def main():
+    args = parse_args()
+    use_bench_database(args.allow_remote)
+
+    # Импорт после выбора базы: app читает DATABASE_URL при загрузке
+    from app import app
+
+    rng = random.Random(args.seed)
+    scenario = load_scenario(app, rng)
+    started = time.perf_counter()
+    if args.url:
+        routes = run_over_http(scenario, args)
+    else:
+        routes = run_in_process(app, scenario, args)
+
+    result = {
+        'mode': 'http' if args.url else 'in-process',
+        'target': args.url or app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'threads': args.threads if args.url else 1,
+        'requests_per_route': args.requests,
+        'elapsed_seconds': round(time.perf_counter() - started, 2),
+        'routes': routes,
+    }
+
+    regressed = False
+    if args.compare:
+        result['comparison'], regressed = compare(routes, args.compare, args.threshold)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.json:
+        print_result(result, True)
+    else:
+        header = f'{"route":<14}{"req":>6}{"err":>5}{"rps":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"sql":>7}'
+        print(header)
+        for row in routes:
+            queries = '-' if row['queries_mean'] is None else row['queries_mean']
+            print(f'{row["route"]:<14}{row["requests"]:>6}{row["errors"]:>5}{row["throughput_rps"]:>9}'
+                  f'{row["latency_p50_ms"]:>9}{row["latency_p95_ms"]:>9}{row["latency_p99_ms"]:>9}{queries:>7}')
+        for row in result.get('comparison', []):
+            mark = '  ← регрессия' if row['regression'] else ''
+            print(f'{row["route"]:<14} p95 {row["p95_before_ms"]} → {row["p95_after_ms"]} мс '
+                  f'({row["p95_change"]}), SQL {row["queries_before"]} → {row["queries_after"]}{mark}')
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Локальный SMTP-сервер, который принимает письма и никуда их не отправляет.
+
+Заменяет почтовый сервер при проверке уведомлений:
+
+    python -m bench.smtp_sink --port 1025 --delay 2
+    SMTP_URL=smtp://localhost:1025 python app.py
+
+--delay задерживает ответ на каждое письмо (медленный сервер),
+--fail-rate — доля писем, на которые сервер отвечает ошибкой 451.
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Минимальный SMTP: HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, delay=0.0, fail_rate=0.0):
+        super().__init__(address, _SMTPHandler)
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.messages = []
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Запускает сервер в фоновом потоке (для скриптов bench)"""
+        thread = threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True)
+        thread.start()
+        return self
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        self.reply('220 smtp-sink ready')
+        mail_from, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                mail_from, recipients = command[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(chunk)
+                if server.delay:
+                    time.sleep(server.delay)
+                if random.random() < server.fail_rate:
+                    with server.lock:
+                        server.rejected += 1
+                    self.reply('451 Temporary failure')
+                else:
+                    with server.lock:
+                        server.messages.append((mail_from, recipients, b''.join(data)))
+                    self.reply('250 OK: queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--delay', type=float, default=0.0, help='секунд на каждое письмо')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='доля писем с ответом 451')
+    args = parser.parse_args()
+
+    server = SMTPSink((args.host, args.port), delay=args.delay, fail_rate=args.fail_rate)
+    print(f'📨 smtp-sink слушает {args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f'Принято писем: {len(server.messages)}, отклонено: {server.rejected}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, case, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Departure, Order, Tour
+import analytics
+import notifications
+import order_summary
+import recommendations
+from pricing import pricing_engine
+
+# Статусы, в которых заказ занимает места в заезде
+SEAT_HOLDING_STATUSES = ('Ожидание', 'Подтвержден', 'Завершен')
+
+
+class SoldOut(Exception):
+    """В заезде не хватает свободных мест"""
+
+    def __init__(self, start_date, seats_left):
+        super().__init__(f'На {start_date} осталось мест: {seats_left}')
+        self.start_date = start_date
+        self.seats_left = seats_left
+
+
+def _booked_seats(tour_id, start_date):
+    """Места, занятые заказами, сделанными до появления строки заезда"""
+    return db.session.scalar(
+        select(func.coalesce(func.sum(Order.guests_count), 0)).where(
+            Order.tour_id == tour_id,
+            Order.start_date == start_date,
+            Order.status.in_(SEAT_HOLDING_STATUSES),
+        )
+    )
+
+
+def get_or_create_departure(tour, start_date):
+    """id заезда тура на дату; строка создаётся при первом бронировании.
+
+    Если два запроса создают заезд одновременно, второй упирается в
+    уникальный индекс (tour_id, start_date), откатывает свою точку
+    сохранения и берёт строку первого.
+    """
+    query = select(Departure.id).where(Departure.tour_id == tour.id, Departure.start_date == start_date)
+    departure_id = db.session.scalar(query)
+    if departure_id is not None:
+        return departure_id
+
+    # Считаем до точки сохранения: внутри неё должна быть только запись,
+    # иначе SQLite не сможет поднять блокировку до записывающей и сразу
+    # ответит «database is locked» вместо ожидания
+    seats_booked = _booked_seats(tour.id, start_date)
+    try:
+        with db.session.begin_nested():
+            departure = Departure(
+                tour_id=tour.id,
+                start_date=start_date,
+                capacity=tour.capacity,
+                seats_booked=seats_booked,
+            )
+            db.session.add(departure)
+        return departure.id
+    except IntegrityError:
+        return db.session.scalar(query)
+
+
+def reserve_seats(tour, start_date, guests_count):
+    """Атомарно занимает места в заезде или выбрасывает SoldOut.
+
+    Проверка и увеличение счётчика делаются одним UPDATE с условием на
+    вместимость. Конкурирующие транзакции упираются в блокировку строки
+    заезда и перепроверяют условие уже с учётом чужой брони, поэтому
+    продать больше мест, чем есть, нельзя ни на PostgreSQL, ни на SQLite.
+    """
+    departure_id = get_or_create_departure(tour, start_date)
+    result = db.session.execute(
+        update(Departure)
+        .where(Departure.id == departure_id,
+               Departure.seats_booked + guests_count <= Departure.capacity)
+        .values(seats_booked=Departure.seats_booked + guests_count,
+                version=Departure.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        seats_left = db.session.scalar(
+            select(Departure.capacity - Departure.seats_booked).where(Departure.id == departure_id)
+        )
+        raise SoldOut(start_date, max(seats_left or 0, 0))
+
+
+def release_seats(tour_id, start_date, guests_count):
+    """Возвращает места в заезд (отмена или удаление заказа)"""
+    db.session.execute(
+        update(Departure)
+        .where(Departure.tour_id == tour_id, Departure.start_date == start_date)
+        .values(seats_booked=case((Departure.seats_booked > guests_count,
+                                   Departure.seats_booked - guests_count), else_=0),
+                version=Departure.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def update_capacity(tour):
+    """Переносит новую вместимость тура на будущие заезды"""
+    db.session.execute(
+        update(Departure)
+        .where(Departure.tour_id == tour.id, Departure.start_date >= date.today())
+        .values(capacity=tour.capacity, version=Departure.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def sync_capacity(tour_ids):
+    """То же для нескольких туров одним UPDATE (после импорта каталога)"""
+    capacity = select(Tour.capacity).where(Tour.id == Departure.tour_id).scalar_subquery()
+    db.session.execute(
+        update(Departure)
+        .where(Departure.tour_id.in_(tour_ids), Departure.start_date >= date.today(),
+               Departure.capacity != capacity)
+        .values(capacity=capacity, version=Departure.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def book_tour(tour, user_id, start_date, guests_count, **contacts):
+    """Создаёт заказ, заняв места в заезде. Коммит — на вызывающем.
+
+    Стоимость берётся из таблицы цен тура (pricing.py) до того, как
+    транзакция начнёт писать.
+    """
+    quote = pricing_engine.quote(tour.id, start_date, guests_count)
+    reserve_seats(tour, start_date, guests_count)
+    order = Order(
+        user_id=user_id,
+        tour_id=tour.id,
+        guests_count=guests_count,
+        total_price=quote.total,
+        start_date=start_date,
+        end_date=start_date + timedelta(days=tour.duration_days),
+        status='Ожидание',
+        created_at=datetime.utcnow(),
+        **contacts
+    )
+    db.session.add(order)
+    analytics.order_created(order)
+    recommendations.order_created(order)
+    order_summary.orders_changed(user_id)
+    return order
+
+
+def change_order_status(order, new_status):
+    """Меняет статус заказа, освобождая или снова занимая места.
+
+    Восстановление отменённого заказа может выбросить SoldOut, если
+    его места уже проданы. Письмо клиенту ставится в outbox в той же
+    транзакции. Коммит — на вызывающем.
+    """
+    if order.status == new_status:
+        return
+    was_holding = order.status in SEAT_HOLDING_STATUSES
+    holds = new_status in SEAT_HOLDING_STATUSES
+    if was_holding and not holds:
+        release_seats(order.tour_id, order.start_date, order.guests_count)
+    elif holds and not was_holding:
+        reserve_seats(order.tour, order.start_date, order.guests_count)
+    analytics.order_status_changed(order, order.status, new_status)
+    order.status = new_status
+    notifications.enqueue_status_change(order, new_status)
+    order_summary.orders_changed(order.user_id)
+
+
+def delete_order(order):
+    """Удаляет заказ и возвращает его места. Коммит — на вызывающем"""
+    if order.status in SEAT_HOLDING_STATUSES:
+        release_seats(order.tour_id, order.start_date, order.guests_count)
+    analytics.order_deleted(order)
+    order_summary.orders_changed(order.user_id)
+    db.session.delete(order)
+
+
+def _seat_groups(conditions):
+    """Сумма гостей выбранных заказов по заездам: [(tour_id, start_date, guests)]"""
+    return db.session.execute(
+        select(Order.tour_id, Order.start_date, func.sum(Order.guests_count))
+        .where(*conditions)
+        .group_by(Order.tour_id, Order.start_date)
+    ).all()
+
+
+def _release_groups(groups):
+    """Возвращает места сразу в несколько заездов одним executemany"""
+    if not groups:
+        return
+    # Через Core-таблицу: ORM-вариант со списком параметров ждёт первичные ключи
+    departure = Departure.__table__
+    db.session.connection().execute(
+        update(departure)
+        .where(departure.c.tour_id == bindparam('b_tour_id'),
+               departure.c.start_date == bindparam('b_start_date'))
+        .values(seats_booked=case((departure.c.seats_booked > bindparam('b_guests'),
+                                   departure.c.seats_booked - bindparam('b_guests')), else_=0),
+                version=departure.c.version + 1),
+        [{'b_tour_id': tour_id, 'b_start_date': start_date, 'b_guests': guests}
+         for tour_id, start_date, guests in groups]
+    )
+
+
+def _require_conditions(conditions):
+    # Массовая операция без единого условия задела бы все заказы
+    if not conditions:
+        raise ValueError('Массовая операция без условий отбора заказов')
+
+
+def bulk_change_status(conditions, new_status):
+    """Меняет статус всех заказов, подходящих под условия, одним UPDATE.
+
+    Заказы, уже находящиеся в new_status, не трогаются. Места в заездах
+    освобождаются или занимаются пачкой по каждому затронутому заезду;
+    если при восстановлении мест не хватает, выбрасывается SoldOut и
+    вызывающий откатывает всю транзакцию. Письма клиентам ставятся в
+    outbox одной пачкой. Возвращает число изменённых заказов. Коммит —
+    на вызывающем.
+    """
+    _require_conditions(conditions)
+    conditions = [*conditions, Order.status != new_status]
+
+    if new_status in SEAT_HOLDING_STATUSES:
+        groups = _seat_groups([*conditions, Order.status.notin_(SEAT_HOLDING_STATUSES)])
+        if groups:
+            tour_ids = {tour_id for tour_id, _, _ in groups}
+            tours = {tour.id: tour for tour in Tour.query.filter(Tour.id.in_(tour_ids))}
+            for tour_id, start_date, guests in groups:
+                reserve_seats(tours[tour_id], start_date, guests)
+    else:
+        _release_groups(_seat_groups([*conditions, Order.status.in_(SEAT_HOLDING_STATUSES)]))
+
+    analytics.bulk_status_changed(conditions, new_status)
+    notifications.enqueue_bulk_status_change(conditions, new_status)
+    order_summary.bulk_orders_changed(conditions)
+    result = db.session.execute(
+        update(Order).where(*conditions).values(status=new_status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def bulk_delete_orders(conditions):
+    """Удаляет все заказы под условиями одним DELETE и возвращает их места.
+
+    Возвращает число удалённых заказов. Коммит — на вызывающем.
+    """
+    _require_conditions(conditions)
+    _release_groups(_seat_groups([*conditions, Order.status.in_(SEAT_HOLDING_STATUSES)]))
+    analytics.bulk_deleted(conditions)
+    order_summary.bulk_orders_changed(conditions)
+    result = db.session.execute(
+        delete(Order).where(*conditions).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
@@ -0,0 +1,158 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalBackend:
+    """Хранилище в памяти процесса.
+
+    Годится для одного воркера и для тестов. При нескольких воркерах
+    gunicorn каждый видит только свои ключи, поэтому инвалидация из
+    одного воркера до остальных не доходит — для этого есть RedisBackend.
+    """
+
+    # Сколько ключей можно накопить, прежде чем выметать просроченные
+    SWEEP_THRESHOLD = 50000
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        if len(self._data) >= self.SWEEP_THRESHOLD and key not in self._data:
+            self._sweep()
+        self._data[key] = (value, expires_at)
+
+    def _sweep(self):
+        # Счётчики ограничения входа создаются на каждый IP и окно времени;
+        # без уборки они копились бы, пока их никто не прочитает
+        now = time.monotonic()
+        for key, (_, expires_at) in list(self._data.items()):
+            if expires_at is not None and expires_at < now:
+                self._data.pop(key, None)
+
+    def counter(self, key):
+        return self.get(key) or 0
+
+    def incr(self, key, ttl=None):
+        """Увеличивает счётчик; ttl задаётся только при его создании"""
+        with self._lock:
+            current = self.get(key)
+            if current is None:
+                self.set(key, 1, ttl)
+                return 1
+            self._data[key] = (current + 1, self._data[key][1])
+            return current + 1
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+
+class RedisBackend:
+    """Общее хранилище для всех воркеров на базе Redis"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('Для CACHE_URL=redis://... установите пакет redis') from e
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, pickle.dumps(value), ex=ttl)
+
+    # Счётчики хранятся как обычные числа Redis, а не через pickle
+    def counter(self, key):
+        return int(self._client.get(key) or 0)
+
+    def incr(self, key, ttl=None):
+        if not ttl:
+            return int(self._client.incr(key))
+        # SET NX создаёт счётчик со сроком жизни только если его ещё нет,
+        # поэтому последующие INCR окно не сдвигают
+        with self._client.pipeline() as pipe:
+            pipe.set(key, 0, ex=ttl, nx=True)
+            pipe.incr(key)
+            return int(pipe.execute()[1])
+
+    def delete(self, key):
+        self._client.delete(key)
+
+
+class TTLCache:
+    """Ограниченный LRU-кеш в памяти процесса с временем жизни записей.
+
+    Считает попадания и промахи, чтобы за кешем можно было следить.
+    """
+
+    def __init__(self, maxsize=10000, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+            'entries': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+        }
+
+
+def create_backend(url=None):
+    """Бэкенд кеша по адресу: пусто — память процесса, redis:// — Redis"""
+    if not url:
+        return LocalBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'Неподдерживаемый CACHE_URL: {url}')
@@ -0,0 +1,181 @@
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import g, has_request_context, request, session, make_response
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+from cache import TTLCache, create_backend
+from models import db, Tour
+from order_summary import summary_cache
+
+VERSION_KEY = 'catalog:version'
+MODIFIED_KEY = 'catalog:modified'
+
+# Неизменяемый снимок строки tour: его можно держать в кеше между запросами
+# и класть в общий бэкенд, не таская за собой сессию SQLAlchemy
+TourSnapshot = namedtuple('TourSnapshot', [
+    'id', 'name', 'description', 'price', 'duration_days', 'destination',
+    'image_url', 'image_digest', 'created_at', 'updated_at', 'is_active',
+])
+
+
+def snapshot_tour(tour):
+    return TourSnapshot(*(getattr(tour, field) for field in TourSnapshot._fields))
+
+
+def load_tour_snapshot(tour_id):
+    tour = db.session.get(Tour, tour_id)
+    return snapshot_tour(tour) if tour else None
+
+
+class CatalogCache:
+    """Кеш каталога туров с инвалидацией по номеру версии.
+
+    Номер версии и время последнего изменения лежат в бэкенде (общем для
+    всех воркеров, если это Redis). Каждая запись кеша привязана к
+    версии, поэтому invalidate() — это просто увеличение номера: старые
+    записи перестают находиться. Записи живут CATALOG_CACHE_TTL секунд,
+    так что записи старых версий истекают и в бэкенде. Поверх бэкенда
+    в каждом процессе держится локальная копия записей текущей версии —
+    LRU не больше CATALOG_CACHE_SIZE записей.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.ttl = 3600
+        self._local = TTLCache(maxsize=1000, ttl=self.ttl)
+        self._local_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        if self.backend is None:
+            self.backend = create_backend(app.config.get('CACHE_URL'))
+        self.ttl = app.config.get('CATALOG_CACHE_TTL', self.ttl)
+        self._local.ttl = self.ttl
+        self._local.maxsize = app.config.get('CATALOG_CACHE_SIZE', self._local.maxsize)
+        app.extensions['catalog_cache'] = self
+
+    def state(self):
+        """Текущие (версия, время изменения) каталога.
+
+        В пределах запроса читается из бэкенда один раз.
+        """
+        if has_request_context() and 'catalog_state' in g:
+            return g.catalog_state
+
+        version = self.backend.counter(VERSION_KEY)
+        modified = self.backend.get(MODIFIED_KEY)
+        if modified is None:
+            modified = datetime.now(timezone.utc).replace(microsecond=0)
+            self.backend.set(MODIFIED_KEY, modified)
+        if has_request_context():
+            g.catalog_state = (version, modified)
+        return version, modified
+
+    def invalidate(self):
+        """Вызывается после любого изменения туров"""
+        if has_request_context():
+            g.pop('catalog_state', None)
+        self.backend.set(MODIFIED_KEY, datetime.now(timezone.utc).replace(microsecond=0))
+        return self.backend.incr(VERSION_KEY)
+
+    def get_or_load(self, key, loader, version=None):
+        """Значение по ключу для текущей версии; при промахе вызывает loader"""
+        if version is None:
+            version, _ = self.state()
+        value = self._lookup(key, version)
+        if value is None:
+            value = loader()
+            self._store(key, value, version)
+        return value
+
+    async def get_or_load_async(self, key, loader, version=None):
+        """То же для асинхронных обработчиков: loader — корутинная функция"""
+        if version is None:
+            version, _ = self.state()
+        value = self._lookup(key, version)
+        if value is None:
+            value = await loader()
+            self._store(key, value, version)
+        return value
+
+    def _lookup(self, key, version):
+        with self._lock:
+            if self._local_version != version:
+                self._local.clear()
+                self._local_version = version
+        value = self._local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        value = self.backend.get(f'catalog:{version}:{key}')
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, value, version)
+        return value
+
+    def _store(self, key, value, version):
+        if value is None:
+            return
+        self.backend.set(f'catalog:{version}:{key}', value, ttl=self.ttl)
+        self._remember(key, value, version)
+
+    def _remember(self, key, value, version):
+        with self._lock:
+            if self._local_version == version:
+                self._local.set(key, value)
+
+    def stats(self):
+        local = self._local.stats()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': local['entries'],
+                'maxsize': local['maxsize'], 'ttl': self.ttl}
+
+    def _etag(self, version, extra=None):
+        # Навбар и кнопки админа зависят от пользователя, поэтому он входит в ETag
+        user = current_user.get_id() if current_user.is_authenticated else 'anon'
+        etag = f'catalog-{version}-{user}'
+        if current_user.is_authenticated and not current_user.is_admin():
+            # Навбар клиента показывает число активных заказов: после брони
+            # или отмены страница должна отрисоваться заново, а не вернуть 304
+            etag = f"{etag}-o{summary_cache.get(current_user.id)['active']}"
+        return f'{etag}-{extra}' if extra is not None else etag
+
+    def not_modified(self, extra=None):
+        """Ответ 304, если у клиента актуальная версия страницы каталога.
+
+        Проверяется до рендеринга шаблона. Если в сессии ждут
+        flash-сообщения, страницу нужно отрисовать, и 304 не отдаётся.
+        extra — то, от чего страница зависит помимо каталога (например,
+        поколение рекомендаций).
+        """
+        if request.method != 'GET' or session.get('_flashes'):
+            return None
+        version, modified = self.state()
+        etag = self._etag(version, extra)
+        if is_resource_modified(request.environ, etag=etag, last_modified=modified):
+            return None
+        response = make_response('', 304)
+        return self._add_validators(response, etag, modified)
+
+    def conditional(self, body, extra=None):
+        """Ответ со страницей каталога и заголовками ETag/Last-Modified"""
+        version, modified = self.state()
+        response = make_response(body)
+        return self._add_validators(response, self._etag(version, extra), modified)
+
+    @staticmethod
+    def _add_validators(response, etag, modified):
+        response.set_etag(etag, weak=True)
+        response.last_modified = modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
+
+
+catalog = CatalogCache()
@@ -0,0 +1,101 @@
+import os
+from config.database import database_config, setup_engines, pool_stats, read_only, RoutingSession
+
+
+def load_config(app):
+    """Заполняет app.config из переменных окружения.
+
+    Единственное место, где читаются настройки: его используют app.py,
+    init.py и config/create_db.py.
+    """
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    app.config.update(database_config())
+
+    # Миграции схемы (migrations.py): при старте процесс сверяет версию схемы
+    # с кодом одним запросом; SCHEMA_AUTO_MIGRATE=1 — сразу применять недостающие
+    # шаги (удобно для одного процесса, для нескольких воркеров — flask db-upgrade)
+    app.config['SCHEMA_CHECK'] = os.environ.get('SCHEMA_CHECK', '1') == '1'
+    app.config['SCHEMA_AUTO_MIGRATE'] = os.environ.get('SCHEMA_AUTO_MIGRATE', '0') == '1'
+
+    # Общий кеш каталога для нескольких воркеров, например redis://localhost:6379/0
+    app.config['CACHE_URL'] = os.environ.get('CACHE_URL')
+    # Записи кеша каталога: время жизни (сек) и сколько их держать в памяти процесса
+    app.config['CATALOG_CACHE_TTL'] = int(os.environ.get('CATALOG_CACHE_TTL', 3600))
+    app.config['CATALOG_CACHE_SIZE'] = int(os.environ.get('CATALOG_CACHE_SIZE', 1000))
+    # Кеш отрисованных карточек туров; FRAGMENT_CACHE=0 отключает его
+    app.config['FRAGMENT_CACHE'] = os.environ.get('FRAGMENT_CACHE', '1') != '0'
+    # Кеш пользователей для user_loader: время жизни записи (сек) и размер
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))
+
+    # Уведомления клиентам. Без SMTP_URL письма только печатаются в лог.
+    # NOTIFY_WORKER: thread — поток в каждом процессе приложения,
+    # process — отдельный процесс notify_worker.py, off — не отправлять
+    app.config['SMTP_URL'] = os.environ.get('SMTP_URL')
+    app.config['MAIL_FROM'] = os.environ.get('MAIL_FROM', 'Туристическое агентство <noreply@tours.com>')
+    app.config['NOTIFY_WORKER'] = os.environ.get('NOTIFY_WORKER', 'thread')
+    app.config['NOTIFY_BATCH_SIZE'] = int(os.environ.get('NOTIFY_BATCH_SIZE', 50))
+    app.config['NOTIFY_SEND_THREADS'] = int(os.environ.get('NOTIFY_SEND_THREADS', 4))
+    app.config['NOTIFY_MAX_ATTEMPTS'] = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', 8))
+    app.config['NOTIFY_RETRY_BASE'] = int(os.environ.get('NOTIFY_RETRY_BASE', 30))
+    app.config['NOTIFY_POLL_INTERVAL'] = float(os.environ.get('NOTIFY_POLL_INTERVAL', 5))
+
+    # Профилирование запросов (instrumentation.py): порог медленного запроса,
+    # сколько SQL показывать в логе, выборочный cProfile для эндпоинтов
+    # из PROFILE_ENDPOINTS (через запятую) и токен для /metrics
+    app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', 500))
+    app.config['PROFILE_TOP_STATEMENTS'] = int(os.environ.get('PROFILE_TOP_STATEMENTS', 5))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_ENDPOINTS'] = [name.strip() for name in os.environ.get('PROFILE_ENDPOINTS', '').split(',')
+                                       if name.strip()]
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+    # Хеширование паролей (passwords.py): метод и стоимость в формате Werkzeug,
+    # число процессов пула (0 — считать в самом воркере), сколько задач может
+    # ждать в очереди и сколько секунд ждать результат
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 8))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Ограничение попыток входа (login_throttle.py): все попытки с одного IP
+    # и неудачные попытки на один логин за окно в секундах; 0 отключает лимит
+    app.config['LOGIN_IP_LIMIT'] = int(os.environ.get('LOGIN_IP_LIMIT', 30))
+    app.config['LOGIN_IP_WINDOW'] = int(os.environ.get('LOGIN_IP_WINDOW', 60))
+    app.config['LOGIN_USER_LIMIT'] = int(os.environ.get('LOGIN_USER_LIMIT', 10))
+    app.config['LOGIN_USER_WINDOW'] = int(os.environ.get('LOGIN_USER_WINDOW', 900))
+    # Сколько прокси перед приложением добавляют X-Forwarded-For (на Render — 1)
+    app.config['PROXY_FIX_X_FOR'] = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+
+    # Сводка заказов пользователя для навбара и профиля: время жизни записи (сек)
+    app.config['ORDER_SUMMARY_TTL'] = int(os.environ.get('ORDER_SUMMARY_TTL', 300))
+
+    # Рекомендации туров (recommendations.py): как часто (сек) пересобирается
+    # индекс похожих и популярных туров из tour_pair и витрины аналитики
+    app.config['RECOMMENDATIONS_TTL'] = int(os.environ.get('RECOMMENDATIONS_TTL', 300))
+
+    # Цены туров (pricing.py): на сколько дней вперёд таблица цен тура
+    # считается заранее; даты дальше горизонта считаются по правилам на лету
+    app.config['PRICING_HORIZON_DAYS'] = int(os.environ.get('PRICING_HORIZON_DAYS', 400))
+
+    # Архив заказов (order_archive.py, flask archive-orders): завершённые и отменённые
+    # заказы уходят в order_archive, если поездка прошла и статус не менялся столько дней
+    app.config['ORDER_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 180))
+
+    # Асинхронный режим (async_views.py): страницы каталога и заказов ходят в базу
+    # через асинхронный драйвер. Адрес по умолчанию выводится из DATABASE_URL
+    # (pg8000 → asyncpg, sqlite → aiosqlite); ASYNC_POOL_SIZE — пул на процесс
+    app.config['ASYNC_MODE'] = os.environ.get('ASYNC_MODE', '0') == '1'
+    app.config['ASYNC_DATABASE_URL'] = os.environ.get('ASYNC_DATABASE_URL')
+    app.config['ASYNC_DATABASE_REPLICA_URL'] = os.environ.get('ASYNC_DATABASE_REPLICA_URL')
+    app.config['ASYNC_POOL_SIZE'] = int(os.environ.get('ASYNC_POOL_SIZE', 10))
+
+    # Картинки туров (images.py): уменьшенные копии в локальном кеше (нужен Pillow).
+    # Каталог по умолчанию — instance/images; на Render его стоит держать на диске,
+    # который переживает деплой, иначе варианты придётся собрать заново (flask images-fetch)
+    app.config['IMAGE_PIPELINE'] = os.environ.get('IMAGE_PIPELINE', '1') == '1'
+    app.config['IMAGE_CACHE_DIR'] = os.environ.get('IMAGE_CACHE_DIR')
+    app.config['IMAGE_QUALITY'] = int(os.environ.get('IMAGE_QUALITY', 82))
+    app.config['IMAGE_MAX_BYTES'] = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    app.config['IMAGE_FETCH_TIMEOUT'] = float(os.environ.get('IMAGE_FETCH_TIMEOUT', 10))
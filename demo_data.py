@@ -0,0 +1,59 @@
+from sqlalchemy import select
+from models import db, Tour, User
+
+# Учётные записи для разработки и демонстрации: (логин, email, роль, пароль)
+DEMO_USERS = [
+    ('admin', 'admin@tours.com', 'admin', 'admin123'),
+    ('user', 'user@example.com', 'user', 'user123'),
+]
+
+DEMO_TOURS = [
+    {
+        'name': 'Парижский романтизм',
+        'description': 'Романтическая прогулка по Парижу с посещением Эйфелевой башни и Лувра.',
+        'price': 1500.0,
+        'duration_days': 7,
+        'destination': 'Париж, Франция',
+        'image_url': 'https://images.unsplash.com/photo-1502602898536-47ad22581b52?ixlib=rb-4.0.3&auto=format&fit=crop&w=1000&q=80',
+    },
+    {
+        'name': 'Горные приключения в Альпах',
+        'description': 'Трекинг и катание на лыжах в швейцарских Альпах.',
+        'price': 2500.0,
+        'duration_days': 10,
+        'destination': 'Альпы, Швейцария',
+        'image_url': 'https://images.unsplash.com/photo-1506905925346-21bda4d32df4?ixlib=rb-4.0.3&auto=format&fit=crop&w=1000&q=80',
+    },
+    {
+        'name': 'Пляжный релакс на Бали',
+        'description': 'Расслабьтесь на белоснежных пляжах с йогой и спа.',
+        'price': 2000.0,
+        'duration_days': 14,
+        'destination': 'Бали, Индонезия',
+        'image_url': 'https://images.unsplash.com/photo-1518548419970-58e3b4079ab2?ixlib=rb-4.0.3&auto=format&fit=crop&w=1000&q=80',
+    },
+]
+
+
+def seed():
+    """Создаёт тестовых пользователей и туры, которых ещё нет.
+
+    Раньше это делал каждый запуск приложения; теперь только команда
+    flask seed. Коммит — на вызывающем. Возвращает (пользователей, туров).
+    """
+    usernames = [username for username, _, _, _ in DEMO_USERS]
+    existing = set(db.session.scalars(select(User.username).where(User.username.in_(usernames))))
+    users = 0
+    for username, email, role, password in DEMO_USERS:
+        if username in existing:
+            continue
+        user = User(username=username, email=email, role=role)
+        user.set_password(password)
+        db.session.add(user)
+        users += 1
+
+    tours = 0
+    if db.session.scalar(select(Tour.id).limit(1)) is None:
+        db.session.add_all(Tour(**tour) for tour in DEMO_TOURS)
+        tours = len(DEMO_TOURS)
+    return users, tours
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """Кеш отрисованных кусков шаблонов в памяти процесса.
+
+    Ключ фрагмента должен включать всё, от чего зависит его HTML
+    (для карточки тура — id и updated_at), тогда отдельная инвалидация
+    не нужна: после правки тура ключ меняется, а старая запись со
+    временем вытесняется по LRU.
+    """
+
+    def __init__(self, maxsize=20000):
+        self.maxsize = maxsize
+        self.enabled = True
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('FRAGMENT_CACHE', True)
+        self.maxsize = app.config.get('FRAGMENT_CACHE_SIZE', self.maxsize)
+        app.add_template_global(self.tour_card)
+        app.extensions['fragment_cache'] = self
+
+    def render(self, template_name, key, **context):
+        if not self.enabled:
+            return self._render(template_name, context)
+
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+
+        self.misses += 1
+        fragment = self._render(template_name, context)
+        with self._lock:
+            self._fragments[key] = fragment
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    @staticmethod
+    def _render(template_name, context):
+        # Напрямую через окружение Jinja: без контекст-процессоров и сигналов,
+        # которые нужны странице целиком, но не её кусочку
+        template = current_app.jinja_env.get_template(template_name)
+        return Markup(template.render(**context))
+
+    def tour_card(self, tour):
+        """Карточка тура для каталога (без кнопок администратора)"""
+        return self.render('_tour_card.html', ('tour_card', tour.id, tour.updated_at), tour=tour)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._fragments)}
+
+
+fragments = FragmentCache()
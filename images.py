@@ -0,0 +1,194 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from urllib.request import Request, urlopen
+from flask import send_file, url_for
+
+# Варианты картинок тура: (ширина, высота, обрезать под размер).
+# Размеры — двойные от того, что показывает вёрстка, для экранов с высокой
+# плотностью: карточка каталога 250px в высоту, страница тура — 500px.
+VARIANTS = {
+    'card': (800, 500, True),
+    'detail': (1600, 1000, False),
+}
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ImageError(ValueError):
+    """Файл или ссылка не дают пригодной картинки"""
+
+
+def variant_filename(variant):
+    # Размер входит в имя файла: при смене размеров меняется и URL,
+    # поэтому браузеры не держат старую картинку с immutable-заголовком
+    width, height, _ = VARIANTS[variant]
+    return f'{variant}-{width}x{height}.jpg'
+
+
+class ImageStore:
+    """Картинки туров в локальном кеше с вариантами нужных размеров.
+
+    Исходник скачивается (или загружается администратором) один раз и
+    лежит на диске под своим sha256, рядом — уменьшенные и пережатые
+    варианты из VARIANTS. URL варианта содержит хеш исходника и размер,
+    то есть никогда не меняет содержимое, поэтому отдаётся с заголовком
+    Cache-Control: immutable на год. Хеш хранится в Tour.image_digest.
+
+    Pillow — необязательная зависимость: без неё (или с IMAGE_PIPELINE=0)
+    шаблоны показывают исходные ссылки, как раньше.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.root = None
+        self.quality = 82
+        self.max_bytes = 10 * 1024 * 1024
+        self.max_pixels = 40_000_000
+        self.fetch_timeout = 10
+        self.max_age = 365 * 24 * 3600
+
+    def init_app(self, app):
+        try:
+            import PIL  # noqa: F401
+            available = True
+        except ImportError:
+            available = False
+        if app.config.get('IMAGE_PIPELINE', True) and not available:
+            app.logger.warning('Pillow не установлен: картинки туров отдаются по исходным ссылкам')
+        self.enabled = app.config.get('IMAGE_PIPELINE', True) and available
+        self.root = app.config.get('IMAGE_CACHE_DIR') or os.path.join(app.instance_path, 'images')
+        self.quality = app.config.get('IMAGE_QUALITY', self.quality)
+        self.max_bytes = app.config.get('IMAGE_MAX_BYTES', self.max_bytes)
+        self.fetch_timeout = app.config.get('IMAGE_FETCH_TIMEOUT', self.fetch_timeout)
+        app.add_template_global(self.tour_image)
+        app.extensions['images'] = self
+
+    def _path(self, kind, digest, suffix=''):
+        return os.path.join(self.root, kind, digest[:2], digest + suffix)
+
+    def original_path(self, digest):
+        return self._path('originals', digest)
+
+    def variant_path(self, digest, variant):
+        return self._path(variant, digest, '-' + variant_filename(variant))
+
+    @staticmethod
+    def _write(path, data):
+        # Через временный файл: параллельный запрос не увидит недописанную картинку
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _open(self, data):
+        from PIL import Image, UnidentifiedImageError
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.width * image.height > self.max_pixels:
+                raise ImageError('Слишком большое разрешение картинки')
+            image.load()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+            raise ImageError('Файл не похож на картинку') from e
+        return image
+
+    def _render(self, data, variant):
+        from PIL import Image, ImageOps
+        width, height, crop = VARIANTS[variant]
+        image = ImageOps.exif_transpose(self._open(data))
+        if image.mode not in ('RGB', 'L'):
+            # Прозрачность JPEG не умеет: кладём картинку на белый фон
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        if crop:
+            image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+    def ingest(self, data):
+        """Сохраняет исходник и все варианты, возвращает хеш"""
+        if len(data) > self.max_bytes:
+            raise ImageError(f'Картинка больше {self.max_bytes // (1024 * 1024)} МБ')
+        self._open(data)
+        digest = hashlib.sha256(data).hexdigest()
+        if not os.path.exists(self.original_path(digest)):
+            self._write(self.original_path(digest), data)
+        for variant in VARIANTS:
+            self.variant(digest, variant)
+        return digest
+
+    def fetch(self, url):
+        """Скачивает картинку по ссылке и сохраняет её, возвращает хеш"""
+        if not url.startswith(('http://', 'https://')):
+            raise ImageError('Поддерживаются только ссылки http(s)')
+        request = Request(url, headers={'User-Agent': 'ToursAgency/1.0'})
+        try:
+            with urlopen(request, timeout=self.fetch_timeout) as response:
+                data = response.read(self.max_bytes + 1)
+        except OSError as e:
+            raise ImageError(f'Не удалось скачать картинку: {e}') from e
+        return self.ingest(data)
+
+    def variant(self, digest, variant):
+        """Путь к файлу варианта (создаётся из исходника при первом обращении).
+
+        None, если исходника на диске нет.
+        """
+        path = self.variant_path(digest, variant)
+        if os.path.exists(path):
+            return path
+        try:
+            with open(self.original_path(digest), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Два запроса могут отрисовать вариант одновременно — файл просто перезапишется
+        self._write(path, self._render(data, variant))
+        return path
+
+    def load(self, upload=None, url=None):
+        """Хеш картинки из загруженного файла или по ссылке; None без Pillow.
+
+        Сессию базы не трогает, поэтому медленное скачивание можно делать
+        после коммита, а не внутри открытой транзакции.
+        """
+        if not self.enabled:
+            return None
+        if upload is not None and upload.filename:
+            return self.ingest(upload.read())
+        if url:
+            return self.fetch(url)
+        return None
+
+    def response(self, digest, filename):
+        """Ответ с файлом варианта или None, если такого варианта нет"""
+        variant = next((name for name in VARIANTS if variant_filename(name) == filename), None)
+        if not self.enabled or variant is None or not DIGEST_RE.match(digest):
+            return None
+        path = self.variant(digest, variant)
+        if path is None:
+            return None
+        response = send_file(path, mimetype='image/jpeg', max_age=self.max_age)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def tour_image(self, tour, variant='card'):
+        """URL картинки тура нужного размера для шаблонов"""
+        if self.enabled and tour.image_digest:
+            return url_for('tour_image_file', digest=tour.image_digest, filename=variant_filename(variant))
+        return tour.image_url
+
+
+images = ImageStore()
@@ -1,16 +1,16 @@
 # create_tables.py
 from app import app, db
-from models import User, Tour, Order
+from migrations import migrator
 
 
 def create_tables():
     with app.app_context():
         try:
-            # Создаем все таблицы
-            db.create_all()
-            print("✅ Все таблицы созданы успешно!")
+            # Создаем или обновляем таблицы по миграциям
+            applied = migrator.upgrade()
+            print(f"✅ Схема базы в версии {migrator.head}, применено шагов: {len(applied)}")
 
-            # Проверяем создание таблицы orders
+            # Проверяем создание таблиц
             from sqlalchemy import inspect
             inspector = inspect(db.engine)
             tables = inspector.get_table_names()
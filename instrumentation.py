@@ -0,0 +1,294 @@
+import cProfile
+import os
+import random
+import tempfile
+import threading
+import time
+from flask import Response, abort, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from models import db
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные движком внутри блока with.
+
+    Используется в тестах и бенчмарках, чтобы проверить, что число
+    запросов на страницу не зависит от количества строк:
+
+        with QueryCounter() as counter:
+            client.get('/admin/orders')
+        assert counter.count <= 3
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        if self.engine is None:
+            self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+
+# Границы корзин гистограммы времени ответа, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _RequestStats:
+    """Замеры одного запроса; живёт в g._request_stats"""
+
+    __slots__ = ('started', 'sql_count', 'sql_time', 'statements', 'template_time',
+                 'template_starts', 'profile')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        # Текст запроса -> [сколько раз, суммарное время]
+        self.statements = {}
+        self.template_time = 0.0
+        self.template_starts = []
+        self.profile = None
+
+
+class _EndpointMetrics:
+    __slots__ = ('buckets', 'duration_sum', 'count', 'sql_count', 'sql_time', 'template_time', 'slow')
+
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration_sum = 0.0
+        self.count = 0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.slow = 0
+
+
+class RequestProfiler:
+    """Замеры каждого запроса: общее время, SQL и отрисовка шаблонов.
+
+    SQL считается по событиям движков SQLAlchemy, шаблоны — по сигналам
+    Flask before_render_template/template_rendered. Медленные запросы
+    (дольше PROFILE_SLOW_MS) пишутся в лог вместе с самыми дорогими
+    SQL-запросами. Накопленные метрики отдаются в формате Prometheus на
+    /metrics; у каждого процесса gunicorn они свои. Для эндпоинтов из
+    PROFILE_ENDPOINTS доля PROFILE_SAMPLE_RATE запросов выполняется под
+    cProfile, а результат сохраняется в PROFILE_DIR.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.slow_ms = 500
+        self.top_statements = 5
+        self.sample_rate = 0.0
+        self.endpoints = frozenset()
+        self.profile_dir = None
+        self.metrics_token = None
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        self._requests = {}
+        self._endpoints = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_ms = app.config.get('PROFILE_SLOW_MS', self.slow_ms)
+        self.top_statements = app.config.get('PROFILE_TOP_STATEMENTS', self.top_statements)
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', self.sample_rate)
+        self.endpoints = frozenset(app.config.get('PROFILE_ENDPOINTS') or ())
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'tours-profiles')
+        self.metrics_token = app.config.get('METRICS_TOKEN')
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+
+        app.before_request(self._start)
+        app.after_request(self._finish_response)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        app.extensions['request_profiler'] = self
+
+    @staticmethod
+    def _current():
+        if has_request_context():
+            return g.get('_request_stats')
+        return None
+
+    # События SQLAlchemy
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current() is not None:
+            conn.info.setdefault('_profile_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._current()
+        starts = conn.info.get('_profile_started')
+        if stats is None or not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        entry = stats.statements.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    # Сигналы Flask
+    def _before_render(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None:
+            stats.template_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None and stats.template_starts:
+            started = stats.template_starts.pop()
+            # Вложенные render_template не считаем дважды
+            if not stats.template_starts:
+                stats.template_time += time.perf_counter() - started
+
+    # Жизненный цикл запроса
+    def _start(self):
+        stats = g._request_stats = _RequestStats()
+        if (self.sample_rate and request.endpoint in self.endpoints
+                and random.random() < self.sample_rate and self._profile_lock.acquire(blocking=False)):
+            # cProfile одновременно работает только в одном потоке процесса
+            stats.profile = cProfile.Profile()
+            stats.profile.enable()
+
+    def _finish_response(self, response):
+        self._finish(response.status_code)
+        return response
+
+    def _teardown(self, exc):
+        # Сюда доходят и запросы, упавшие с исключением до after_request
+        if g.get('_request_stats') is not None:
+            self._finish(500 if exc is not None else 200)
+
+    def _finish(self, status):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return
+        duration = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        slow = duration * 1000 >= self.slow_ms and endpoint != 'static'
+
+        if stats.profile is not None:
+            stats.profile.disable()
+            self._profile_lock.release()
+            self._dump_profile(stats.profile, endpoint)
+
+        with self._lock:
+            key = (endpoint, request.method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = _EndpointMetrics()
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[i] += 1
+            metrics.duration_sum += duration
+            metrics.count += 1
+            metrics.sql_count += stats.sql_count
+            metrics.sql_time += stats.sql_time
+            metrics.template_time += stats.template_time
+            metrics.slow += slow
+
+        if slow:
+            self._log_slow(stats, endpoint, status, duration)
+
+    def _log_slow(self, stats, endpoint, status, duration):
+        top = sorted(stats.statements.items(), key=lambda item: item[1][1], reverse=True)[:self.top_statements]
+        lines = [
+            f'Медленный запрос {request.method} {request.full_path.rstrip("?")} -> {status} ({endpoint}): '
+            f'{duration * 1000:.0f} мс, SQL {stats.sql_count} шт. / {stats.sql_time * 1000:.0f} мс, '
+            f'шаблоны {stats.template_time * 1000:.0f} мс'
+        ]
+        for statement, (count, elapsed) in top:
+            text = ' '.join(statement.split())
+            lines.append(f'  {elapsed * 1000:8.1f} мс  x{count:<4} {text[:300]}')
+        self.app.logger.warning('\n'.join(lines))
+
+    def _dump_profile(self, profile, endpoint):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f'{endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.prof')
+            profile.dump_stats(path)
+            self.app.logger.warning(f'Профиль {endpoint} сохранён в {path}')
+        except OSError as e:
+            self.app.logger.error(f'Не удалось сохранить профиль {endpoint}: {e}')
+
+    # /metrics
+    def metrics_view(self):
+        if self.metrics_token and request.headers.get('Authorization') != f'Bearer {self.metrics_token}':
+            abort(401)
+        return Response(self.render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def render_metrics(self):
+        """Метрики процесса в текстовом формате Prometheus"""
+        with self._lock:
+            requests = dict(self._requests)
+            endpoints = {name: (list(m.buckets), m.duration_sum, m.count, m.sql_count,
+                                m.sql_time, m.template_time, m.slow)
+                         for name, m in self._endpoints.items()}
+
+        lines = [
+            '# HELP http_requests_total Обработанные запросы.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Время обработки запроса.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for endpoint, (buckets, duration_sum, count, *_) in sorted(endpoints.items()):
+            for bound, value in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {value}')
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {count}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {duration_sum:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {count}')
+
+        for name, index, kind, help_text in (
+            ('http_request_sql_queries_total', 3, 'counter', 'SQL-запросы, выполненные при обработке запросов.'),
+            ('http_request_sql_seconds_total', 4, 'counter', 'Время SQL-запросов.'),
+            ('http_request_template_seconds_total', 5, 'counter', 'Время отрисовки шаблонов.'),
+            ('http_slow_requests_total', 6, 'counter', 'Запросы дольше PROFILE_SLOW_MS.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for endpoint, values in sorted(endpoints.items()):
+                value = values[index]
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+
+        pools = [(bind, engine.pool) for bind, engine in db.engines.items()]
+        pools = [(bind, pool.stats()) for bind, pool in pools if hasattr(pool, 'stats')]
+        if pools:
+            for name, key, help_text in (
+                ('db_pool_checked_out', 'checked_out', 'Соединения, выданные из пула.'),
+                ('db_pool_wait_seconds_total', 'wait_total_seconds', 'Суммарное ожидание соединения.'),
+                ('db_pool_timeouts_total', 'timeouts', 'Таймауты ожидания соединения.'),
+            ):
+                kind = 'gauge' if name == 'db_pool_checked_out' else 'counter'
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for bind, stats in pools:
+                    lines.append(f'{name}{{bind="{bind or "primary"}"}} {stats[key]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+profiler = RequestProfiler()
@@ -0,0 +1,70 @@
+import time
+from cache import create_backend
+
+
+class LoginThrottle:
+    """Ограничение попыток входа и регистрации.
+
+    Проверяется до поиска пользователя и хеширования, поэтому перебор
+    паролей отсекается почти бесплатно. Два счётчика в окнах
+    фиксированной длины:
+
+    * все попытки с одного IP — LOGIN_IP_LIMIT за LOGIN_IP_WINDOW секунд;
+    * неудачные попытки для одного логина с любых адресов —
+      LOGIN_USER_LIMIT за LOGIN_USER_WINDOW секунд; успешный вход
+      сбрасывает счётчик.
+
+    Счётчики лежат в том же бэкенде, что и кеш каталога (CACHE_URL), так
+    что с Redis лимиты общие для всех воркеров. За обратным прокси адрес
+    клиента берётся из X-Forwarded-For (см. PROXY_FIX_X_FOR в config).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.ip_limit = 30
+        self.ip_window = 60
+        self.user_limit = 10
+        self.user_window = 900
+
+    def init_app(self, app):
+        if self.backend is None:
+            self.backend = create_backend(app.config.get('CACHE_URL'))
+        self.ip_limit = app.config.get('LOGIN_IP_LIMIT', self.ip_limit)
+        self.ip_window = app.config.get('LOGIN_IP_WINDOW', self.ip_window)
+        self.user_limit = app.config.get('LOGIN_USER_LIMIT', self.user_limit)
+        self.user_window = app.config.get('LOGIN_USER_WINDOW', self.user_window)
+        app.extensions['login_throttle'] = self
+
+    @staticmethod
+    def _window(length):
+        """Ключ текущего окна и сколько секунд до его конца"""
+        now = time.time()
+        return int(now // length), int(length - now % length) + 1
+
+    def _user_key(self, username, window):
+        return f'login:user:{username.strip().lower()}:{window}'
+
+    def attempt(self, ip, username=None):
+        """Учитывает попытку. Возвращает 0 или через сколько секунд повторить"""
+        if self.ip_limit:
+            window, retry_after = self._window(self.ip_window)
+            if self.backend.incr(f'login:ip:{ip}:{window}', ttl=self.ip_window) > self.ip_limit:
+                return retry_after
+        if username and self.user_limit:
+            window, retry_after = self._window(self.user_window)
+            if self.backend.counter(self._user_key(username, window)) >= self.user_limit:
+                return retry_after
+        return 0
+
+    def failed(self, username):
+        if self.user_limit:
+            window, _ = self._window(self.user_window)
+            self.backend.incr(self._user_key(username, window), ttl=self.user_window)
+
+    def succeeded(self, username):
+        if self.user_limit:
+            window, _ = self._window(self.user_window)
+            self.backend.delete(self._user_key(username, window))
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,273 @@
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select, update
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.schema import CreateColumn
+import analytics
+import recommendations
+from models import (db, Departure, Notification, Order, OrderArchive, PriceRule, SalesDaily, Tour, TourPair, User,
+                    ORDER_STAY_DDL, TOUR_SEARCH_DDL)
+
+# Применённые миграции. Таблица не входит в db.metadata, поэтому
+# create_all и drop_all моделей её не трогают
+schema_metadata = MetaData()
+schema_version = Table(
+    'schema_version', schema_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+# Ключ advisory-блокировки PostgreSQL: воркеры, стартующие одновременно,
+# применяют миграции по очереди, а не наперегонки
+SCHEMA_LOCK_KEY = 20240601
+
+Migration = namedtuple('Migration', 'version description upgrade')
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Регистрирует шаг схемы: функцию, которая получает соединение"""
+    def decorator(func):
+        if MIGRATIONS and MIGRATIONS[-1].version >= version:
+            raise ValueError(f'Миграция {version} объявлена после {MIGRATIONS[-1].version}')
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+    return decorator
+
+
+# Шаги написаны так, чтобы их можно было повторить: базы, созданные
+# через create_all до появления миграций, могут уже содержать часть
+# объектов, а прерванный шаг (на SQLite DDL не откатывается) достаточно
+# запустить снова.
+
+def _columns(connection, table):
+    return {column['name'] for column in inspect(connection).get_columns(table.name)}
+
+
+def _add_column(connection, column):
+    """ALTER TABLE ... ADD COLUMN, если колонки нет; True — если добавлена"""
+    if column.name in _columns(connection, column.table):
+        return False
+    table = connection.dialect.identifier_preparer.format_table(column.table)
+    definition = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {definition}')
+    return True
+
+
+def _create_table(connection, table):
+    """Таблица модели вместе с её индексами и DDL; True — если создана"""
+    if inspect(connection).has_table(table.name):
+        return False
+    table.create(connection)
+    return True
+
+
+def _create_indexes(connection, table, *names):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def _run_ddl(connection, table, statements):
+    # DDL из models.py сами проверяют диалект (execute_if) и идемпотентны
+    for ddl in statements:
+        ddl(table, connection)
+
+
+@migration(1, 'Пользователи, туры и заказы')
+def _baseline(connection):
+    for model in (User, Tour, Order):
+        _create_table(connection, model.__table__)
+
+
+@migration(2, 'Индексы доски заказов')
+def _order_board_indexes(connection):
+    _create_indexes(connection, Order.__table__, 'ix_order_status_created_at', 'ix_order_user_id_created_at')
+
+
+@migration(3, 'Время изменения, вместимость и картинка тура')
+def _tour_columns(connection):
+    tour = Tour.__table__
+    if _add_column(connection, tour.c.updated_at):
+        # По updated_at строятся ключи кеша карточек (fragments.py)
+        connection.execute(update(tour).where(tour.c.updated_at.is_(None)).values(updated_at=tour.c.created_at))
+    _add_column(connection, tour.c.capacity)
+    _add_column(connection, tour.c.image_digest)
+
+
+@migration(4, 'Индексы и полнотекстовый поиск каталога')
+def _catalog_search(connection):
+    tour = Tour.__table__
+    _create_indexes(connection, tour, 'ix_tour_destination', 'ix_tour_is_active_price',
+                    'ix_tour_is_active_duration_days', 'ix_tour_is_active_created_at', 'ix_tour_name_destination')
+    _run_ddl(connection, tour, TOUR_SEARCH_DDL)
+    if connection.dialect.name == 'sqlite':
+        # FTS-таблица, созданная после туров, пуста: заполняем её из tour
+        connection.exec_driver_sql("INSERT INTO tour_fts(tour_fts) VALUES ('rebuild')")
+
+
+@migration(5, 'Заезды туров')
+def _departures(connection):
+    _create_table(connection, Departure.__table__)
+
+
+@migration(6, 'Очередь уведомлений')
+def _notifications(connection):
+    _create_table(connection, Notification.__table__)
+
+
+@migration(7, 'Индексы календаря загрузки')
+def _calendar_indexes(connection):
+    _run_ddl(connection, Order.__table__, ORDER_STAY_DDL)
+    _create_indexes(connection, Departure.__table__, 'ix_departure_start_date')
+
+
+@migration(8, 'Архив заказов')
+def _order_archive(connection):
+    _create_table(connection, OrderArchive.__table__)
+
+
+@migration(9, 'Витрина аналитики')
+def _sales_daily(connection):
+    if _create_table(connection, SalesDaily.__table__):
+        # Иначе панель аналитики показала бы нули до ручного analytics-backfill
+        analytics.rebuild(connection)
+
+
+@migration(10, 'Пары туров для рекомендаций')
+def _tour_pairs(connection):
+    if _create_table(connection, TourPair.__table__):
+        recommendations.rebuild_pairs(connection)
+
+
+@migration(11, 'Правила цен туров')
+def _price_rules(connection):
+    _create_table(connection, PriceRule.__table__)
+
+
+class Migrator:
+    """Версионированные миграции схемы вместо create_all при каждом старте.
+
+    Номер каждого применённого шага записывается в schema_version. При
+    старте процесса выполняется один запрос — максимальная версия; если
+    она отстаёт от кода, в лог пишется ошибка, а с SCHEMA_AUTO_MIGRATE=1
+    недостающие шаги применяются сразу. Обычно схему обновляет отдельная
+    команда деплоя (flask db-upgrade), а воркеры только проверяют версию.
+
+    Новая база создаётся целиком через create_all и отмечается последней
+    версией. База, созданная до появления миграций, проходит все шаги по
+    порядку: каждый из них пропускает уже существующие объекты.
+    """
+
+    def __init__(self):
+        self.check = True
+        self.auto_migrate = False
+
+    def init_app(self, app):
+        self.check = app.config.get('SCHEMA_CHECK', self.check)
+        self.auto_migrate = app.config.get('SCHEMA_AUTO_MIGRATE', self.auto_migrate)
+        app.extensions['migrator'] = self
+        if self.check:
+            with app.app_context():
+                self.check_version(app.logger)
+
+    @property
+    def head(self):
+        return MIGRATIONS[-1].version
+
+    @staticmethod
+    def _lock(connection):
+        if connection.dialect.name == 'postgresql':
+            connection.execute(select(func.pg_advisory_xact_lock(SCHEMA_LOCK_KEY)))
+
+    @staticmethod
+    def _stamp(connection, steps):
+        connection.execute(insert(schema_version), [
+            {'version': step.version, 'description': step.description, 'applied_at': datetime.utcnow()}
+            for step in steps
+        ])
+
+    @staticmethod
+    def current_version(connection):
+        """Версия схемы; 0 — таблицы schema_version ещё нет"""
+        try:
+            return connection.scalar(select(func.max(schema_version.c.version))) or 0
+        except DBAPIError:
+            # Наличие таблицы проверяем только после ошибки, чтобы обычный
+            # старт обходился одним запросом
+            connection.rollback()
+            if inspect(connection).has_table(schema_version.name):
+                raise
+            return 0
+
+    def version(self):
+        with db.engine.connect() as connection:
+            return self.current_version(connection)
+
+    def check_version(self, logger):
+        """Проверка при старте: не бросает исключений, только пишет в лог"""
+        try:
+            current = self.version()
+        except SQLAlchemyError as e:
+            logger.error('Не удалось проверить версию схемы базы: %s', e)
+            return
+        if current >= self.head:
+            if current > self.head:
+                logger.warning('Схема базы (версия %s) новее кода (версия %s)', current, self.head)
+            return
+        if not self.auto_migrate:
+            logger.error('Схема базы устарела: версия %s, код ждёт %s. Выполните flask db-upgrade',
+                         current, self.head)
+            return
+        try:
+            applied = self.upgrade()
+        except SQLAlchemyError:
+            logger.exception('Не удалось обновить схему базы')
+            return
+        logger.warning('Схема базы обновлена до версии %s, применено шагов: %s', self.head, len(applied))
+
+    def upgrade(self):
+        """Применяет недостающие миграции, возвращает список применённых.
+
+        Каждый шаг выполняется в своей транзакции вместе с записью в
+        schema_version. На PostgreSQL транзакция начинается с advisory-
+        блокировки, а версия перечитывается уже под ней.
+        """
+        engine = db.engine
+        with engine.begin() as connection:
+            self._lock(connection)
+            inspector = inspect(connection)
+            if not inspector.has_table(schema_version.name):
+                fresh = not inspector.has_table(Tour.__tablename__)
+                schema_version.create(connection)
+                if fresh:
+                    db.metadata.create_all(connection)
+                    self._stamp(connection, MIGRATIONS)
+                    return list(MIGRATIONS)
+            current = self.current_version(connection)
+        if current >= self.head:
+            return []
+
+        applied = []
+        for step in MIGRATIONS:
+            with engine.begin() as connection:
+                self._lock(connection)
+                if step.version <= self.current_version(connection):
+                    continue
+                step.upgrade(connection)
+                self._stamp(connection, [step])
+            applied.append(step)
+        return applied
+
+    def history(self):
+        """[(версия, описание, когда применена или None)] по всем шагам"""
+        with db.engine.connect() as connection:
+            applied = {}
+            if inspect(connection).has_table(schema_version.name):
+                applied = dict(connection.execute(select(schema_version.c.version, schema_version.c.applied_at)).all())
+        return [(step.version, step.description, applied.get(step.version)) for step in MIGRATIONS]
+
+
+migrator = Migrator()
@@ -1,9 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from config.database import RoutingSession
+from passwords import hasher
 
-db = SQLAlchemy()
+# Статусы заказа в порядке колонок доски администратора
+ORDER_STATUSES = ('Ожидание', 'Подтвержден', 'Завершен', 'Отменен')
+
+# RoutingSession отправляет чтение из read_only-обработчиков на реплику, если она настроена
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class User(UserMixin, db.Model):
@@ -19,11 +25,16 @@ class User(UserMixin, db.Model):
     # Связь с заказами
     orders = db.relationship('Order', backref='user', lazy=True, cascade='all, delete-orphan')
 
+    # Хеш считается в пуле процессов passwords.hasher; при переполненной
+    # очереди оба метода выбрасывают passwords.HasherBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return hasher.needs_rehash(self.password_hash)
 
     def is_admin(self):
         return self.role == 'admin'
@@ -34,6 +45,15 @@ class User(UserMixin, db.Model):
 
 class Tour(db.Model):
     __tablename__ = 'tour'
+    __table_args__ = (
+        # Фильтры и сортировки каталога (см. tour_search.py)
+        db.Index('ix_tour_destination', 'destination'),
+        db.Index('ix_tour_is_active_price', 'is_active', 'price'),
+        db.Index('ix_tour_is_active_duration_days', 'is_active', 'duration_days'),
+        db.Index('ix_tour_is_active_created_at', 'is_active', 'created_at'),
+        # Естественный ключ импорта каталога (см. tour_import.py)
+        db.Index('ix_tour_name_destination', 'name', 'destination'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -42,8 +62,13 @@ class Tour(db.Model):
     duration_days = db.Column(db.Integer, nullable=False)
     destination = db.Column(db.String(100), nullable=False)
     image_url = db.Column(db.String(500), default='https://via.placeholder.com/300x200?text=Tour+Image')
+    # sha256 картинки в локальном кеше (images.py); None — показывается image_url
+    image_digest = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Мест в одном заезде (на одну дату начала)
+    capacity = db.Column(db.Integer, nullable=False, default=20, server_default='20')
 
     # Связь с заказами
     orders = db.relationship('Order', backref='tour', lazy=True)
@@ -52,8 +77,97 @@ class Tour(db.Model):
         return f'<Tour {self.name}>'
 
 
+# Полнотекстовый поиск по названию и описанию тура. В модели этих объектов нет:
+# на PostgreSQL это вычисляемая колонка tsvector с GIN-индексом, на SQLite —
+# внешняя FTS5-таблица, которую синхронизируют триггеры. Инструкции
+# идемпотентны: их же повторяет миграция для старых баз (migrations.py).
+TOUR_SEARCH_DDL = [
+    DDL(
+        "ALTER TABLE tour ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('russian', coalesce(name, '') || ' ' || coalesce(description, ''))) STORED"
+    ).execute_if(dialect='postgresql'),
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_tour_search_vector ON tour USING GIN (search_vector)"
+    ).execute_if(dialect='postgresql'),
+] + [DDL(statement).execute_if(dialect='sqlite') for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tour_fts USING fts5(name, description, content='tour', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS tour_fts_ai AFTER INSERT ON tour BEGIN "
+    "INSERT INTO tour_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS tour_fts_ad AFTER DELETE ON tour BEGIN "
+    "INSERT INTO tour_fts(tour_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS tour_fts_au AFTER UPDATE ON tour BEGIN "
+    "INSERT INTO tour_fts(tour_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO tour_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+)]
+for ddl in TOUR_SEARCH_DDL:
+    event.listen(Tour.__table__, 'after_create', ddl)
+event.listen(Tour.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS tour_fts").execute_if(dialect='sqlite'))
+
+
+class Departure(db.Model):
+    """Заезд тура на конкретную дату и занятые в нём места"""
+    __tablename__ = 'departure'
+    __table_args__ = (
+        db.UniqueConstraint('tour_id', 'start_date', name='uq_departure_tour_start_date'),
+        # Календарь загрузки по всем турам ищет заезды по дате
+        db.Index('ix_departure_start_date', 'start_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tour_id = db.Column(db.Integer, db.ForeignKey('tour.id', ondelete='CASCADE'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+    seats_booked = db.Column(db.Integer, nullable=False, default=0)
+    # Увеличивается при каждом изменении занятых мест
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    tour = db.relationship('Tour', backref=db.backref('departures', lazy=True, cascade='all, delete-orphan'))
+
+    @property
+    def seats_left(self):
+        return max(self.capacity - self.seats_booked, 0)
+
+    def __repr__(self):
+        return f'<Departure {self.tour_id} {self.start_date} {self.seats_booked}/{self.capacity}>'
+
+
+class PriceRule(db.Model):
+    """Правило цены тура: сезонная цена, надбавка на даты или групповая скидка.
+
+    Правило без tour_id действует на все туры. Правила не читаются при
+    каждом расчёте: pricing.py собирает их в таблицу цен по дням и
+    держит её в кеше до следующего изменения каталога.
+    """
+    __tablename__ = 'price_rule'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tour_id = db.Column(db.Integer, db.ForeignKey('tour.id', ondelete='CASCADE'), nullable=True, index=True)
+    # season — процент к цене на даты, surcharge — надбавка на даты или дни
+    # недели (процент и/или сумма с человека), group — скидка от min_guests гостей
+    kind = db.Column(db.String(20), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    date_from = db.Column(db.Date, nullable=True)
+    date_to = db.Column(db.Date, nullable=True)
+    # Дни недели строкой цифр weekday(): '56' — суббота и воскресенье
+    weekdays = db.Column(db.String(7), nullable=True)
+    min_guests = db.Column(db.Integer, nullable=True)
+    percent = db.Column(db.Float, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    tour = db.relationship('Tour', backref=db.backref('price_rules', lazy=True, cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<PriceRule {self.id} {self.kind} {self.tour_id}>'
+
+
 class Order(db.Model):
     __tablename__ = 'order'
+    __table_args__ = (
+        # Колонки доски заказов и «Мои заказы» читаются диапазоном по этим индексам
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        db.Index('ix_order_user_id_created_at', 'user_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -76,8 +190,157 @@ class Order(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def calculate_total_price(self):
-        """Расчет общей стоимости заказа"""
-        return self.tour.price * self.guests_count
+        """Расчет общей стоимости заказа по таблице цен тура, без загрузки self.tour"""
+        # Импорт здесь: pricing сам импортирует модели
+        from pricing import pricing_engine
+        return pricing_engine.quote(self.tour_id, self.start_date, self.guests_count).total
+
+    def __repr__(self):
+        return f'<Order {self.id} - {self.user.username} - {self.tour.name}>'
+
+
+# Поиск заказов, чьи поездки пересекаются с диапазоном дат (availability.py).
+# На PostgreSQL — GiST-индекс по daterange(start_date, end_date) под оператор &&,
+# на остальных СУБД — обычный составной индекс по датам.
+ORDER_STAY_DDL = [
+    DDL(
+        'CREATE INDEX IF NOT EXISTS ix_order_stay ON "order" USING GIST (daterange(start_date, end_date))'
+    ).execute_if(dialect='postgresql'),
+    DDL(
+        'CREATE INDEX IF NOT EXISTS ix_order_start_date_end_date ON "order" (start_date, end_date)'
+    ).execute_if(callable_=lambda ddl, target, bind, **kw: bind.dialect.name != 'postgresql'),
+]
+for ddl in ORDER_STAY_DDL:
+    event.listen(Order.__table__, 'after_create', ddl)
+
+
+class OrderArchive(db.Model):
+    """Завершённые и отменённые заказы, перенесённые из order (order_archive.py).
+
+    Колонки те же, что у Order, плюс время переноса. На PostgreSQL таблица
+    секционирована по месяцам created_at: секции создаёт задача архивации,
+    поэтому старые месяцы можно отсоединять и удалять целиком. Первичный
+    ключ секционированной таблицы обязан включать created_at.
+    """
+    __tablename__ = 'order_archive'
+    __table_args__ = (
+        # История заказов клиента читается диапазоном по этому индексу
+        db.Index('ix_order_archive_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    created_at = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    tour_id = db.Column(db.Integer, db.ForeignKey('tour.id'), nullable=False)
+
+    guests_count = db.Column(db.Integer, nullable=False)
+    total_price = db.Column(db.Float, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+    contact_phone = db.Column(db.String(20), nullable=False)
+    contact_email = db.Column(db.String(120), nullable=False)
+    special_requests = db.Column(db.Text, nullable=True)
+
+    status = db.Column(db.String(20), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    tour = db.relationship('Tour', viewonly=True)
+    user = db.relationship('User', viewonly=True)
+
+    def __repr__(self):
+        return f'<OrderArchive {self.id} {self.status}>'
+
+
+def _partition_by_month(table, connection, **kw):
+    # Опция секционирования задаётся только перед CREATE TABLE на PostgreSQL:
+    # в __table_args__ она заставила бы каждый импорт models загружать диалект
+    # PostgreSQL, даже когда приложение работает на SQLite
+    if connection.dialect.name == 'postgresql':
+        table.dialect_kwargs['postgresql_partition_by'] = 'RANGE (created_at)'
+
+
+event.listen(OrderArchive.__table__, 'before_create', _partition_by_month)
+
+# Секция по умолчанию ловит строки месяцев, для которых ещё нет своей секции
+ORDER_ARCHIVE_DDL = [
+    DDL(
+        'CREATE TABLE IF NOT EXISTS order_archive_default PARTITION OF order_archive DEFAULT'
+    ).execute_if(dialect='postgresql'),
+]
+for ddl in ORDER_ARCHIVE_DDL:
+    event.listen(OrderArchive.__table__, 'after_create', ddl)
+
+
+class SalesDaily(db.Model):
+    """Дневные итоги заказов по туру и статусу — витрина для аналитики.
+
+    День — дата создания заказа (UTC). Строки обновляются приращениями
+    вместе с заказами (см. analytics.py), поэтому панель аналитики не
+    читает таблицу order.
+    """
+    __tablename__ = 'sales_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    # Без внешнего ключа: витрину можно пересобрать независимо от туров
+    tour_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    guests_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SalesDaily {self.day} {self.tour_id} {self.status} {self.orders_count}>'
+
+
+class TourPair(db.Model):
+    """Сколько клиентов заказывали оба тура — «с этим туром также бронируют».
+
+    Строка хранится в обе стороны (tour_id, other_tour_id), чтобы похожие
+    туры читались по первичному ключу. Обновляется при новых заказах и
+    пересобирается целиком (см. recommendations.py).
+    """
+    __tablename__ = 'tour_pair'
+
+    # Без внешних ключей: таблицу можно пересобрать независимо от туров
+    tour_id = db.Column(db.Integer, primary_key=True)
+    other_tour_id = db.Column(db.Integer, primary_key=True)
+    customers = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<TourPair {self.tour_id} {self.other_tour_id} {self.customers}>'
+
+
+class Notification(db.Model):
+    """Исходящее уведомление клиенту (outbox).
+
+    Пишется в той же транзакции, что и изменение заказа, а отправляет
+    его фоновый воркер из notifications.py.
+    """
+    __tablename__ = 'notification'
+    __table_args__ = (
+        # Воркер выбирает готовые к отправке записи диапазоном по этому индексу
+        db.Index('ix_notification_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Без внешнего ключа: уведомление должно пережить удаление заказа
+    order_id = db.Column(db.Integer, nullable=True)
+    channel = db.Column(db.String(20), nullable=False, default='email')
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+    # pending — ждёт отправки, sent — отправлено, failed — попытки исчерпаны
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Метка воркера, который сейчас отправляет запись
+    claimed_by = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
 
     def __repr__(self):
-        return f'<Order {self.id} - {self.user.username} - {self.tour.name}>'
\ No newline at end of file
+        return f'<Notification {self.id} {self.status} {self.recipient}>'
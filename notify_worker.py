@@ -0,0 +1,17 @@
+# notify_worker.py
+"""Отдельный процесс отправки уведомлений из outbox.
+
+Запускается вместе с gunicorn, если в приложении задано NOTIFY_WORKER=process:
+
+    NOTIFY_WORKER=process python notify_worker.py
+"""
+from app import app
+from notifications import outbox
+
+
+if __name__ == '__main__':
+    print("📨 Воркер уведомлений запущен")
+    try:
+        outbox.run()
+    except KeyboardInterrupt:
+        print("📨 Воркер уведомлений остановлен")
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, literal, select, text
+from sqlalchemy.orm import contains_eager
+from models import db, Order, OrderArchive
+from order_summary import ORDERS_PER_PAGE, bulk_orders_changed, user_orders_page
+
+# Заказы в этих статусах больше не меняются и уходят в архив
+ARCHIVE_STATUSES = ('Завершен', 'Отменен')
+
+# Сколько заказов переносится одной транзакцией
+ARCHIVE_BATCH_SIZE = 1000
+
+# Колонки order в том же порядке, что и в order_archive
+_COLUMNS = [column.name for column in Order.__table__.columns]
+
+
+def archive_conditions(older_than_days, now=None):
+    """Условия выбора заказов для архива.
+
+    Поездка должна закончиться, а статус не меняться older_than_days дней:
+    такие заказы не занимают места в заездах и не нужны доске и «Моим
+    заказам».
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    return [
+        Order.status.in_(ARCHIVE_STATUSES),
+        Order.created_at.isnot(None),
+        Order.end_date < now.date(),
+        func.coalesce(Order.updated_at, Order.created_at) < cutoff,
+    ]
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def ensure_partitions(months):
+    """Создаёт месячные секции order_archive (только PostgreSQL)"""
+    if db.session.connection().dialect.name != 'postgresql':
+        return
+    for month in sorted(months):
+        following = _month_start(month + timedelta(days=32))
+        db.session.execute(text(
+            f'CREATE TABLE IF NOT EXISTS order_archive_{month:%Y_%m} PARTITION OF order_archive '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        ))
+
+
+def archive_batch(conditions, batch_size=ARCHIVE_BATCH_SIZE, now=None):
+    """Переносит в архив одну пачку заказов под условиями, возвращает их число.
+
+    INSERT ... SELECT и DELETE по одним и тем же id в одной транзакции:
+    заказ всегда лежит ровно в одной из таблиц. Коммит — на вызывающем.
+    """
+    rows = db.session.execute(
+        select(Order.id, Order.created_at).where(*conditions).order_by(Order.id).limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+    ids = [order_id for order_id, _ in rows]
+    ensure_partitions({_month_start(created_at) for _, created_at in rows})
+
+    moved = [Order.id.in_(ids)]
+    # Сводки «Моих заказов» этих клиентов сбросятся после коммита
+    bulk_orders_changed(moved)
+    db.session.execute(
+        insert(OrderArchive).from_select(
+            _COLUMNS + ['archived_at'],
+            select(*(getattr(Order, name) for name in _COLUMNS), literal(now or datetime.utcnow()))
+            .where(*moved)
+        )
+    )
+    db.session.execute(delete(Order).where(*moved).execution_options(synchronize_session=False))
+    return len(ids)
+
+
+def archive_orders(older_than_days, batch_size=ARCHIVE_BATCH_SIZE, limit=None, now=None):
+    """Переносит в архив все подходящие заказы пачками, коммитя каждую.
+
+    Короткие транзакции не держат блокировки на order дольше одной пачки.
+    Витрина аналитики и заезды не меняются: архивные заказы остаются в
+    итогах, а занятые ими места — в прошлых заездах. Возвращает число
+    перенесённых заказов.
+    """
+    conditions = archive_conditions(older_than_days, now)
+    total = 0
+    while limit is None or total < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        try:
+            moved = archive_batch(conditions, size, now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        total += moved
+        if moved < size:
+            break
+    return total
+
+
+def count_candidates(older_than_days, now=None):
+    return db.session.scalar(select(func.count(Order.id)).where(*archive_conditions(older_than_days, now)))
+
+
+def user_archive_count_statement(user_id):
+    return select(func.count()).select_from(OrderArchive).where(OrderArchive.user_id == user_id)
+
+
+def user_archive_statement(user_id, page, per_page=ORDERS_PER_PAGE):
+    """Архивные заказы клиента вместе с турами, новые сверху"""
+    return (select(OrderArchive)
+            .join(OrderArchive.tour)
+            .options(contains_eager(OrderArchive.tour))
+            .where(OrderArchive.user_id == user_id)
+            .order_by(OrderArchive.created_at.desc(), OrderArchive.id.desc())
+            .limit(per_page).offset((page - 1) * per_page))
+
+
+def load_user_archive(user_id, page, per_page=ORDERS_PER_PAGE):
+    """Страница архива «Моих заказов»: COUNT и строки страницы"""
+    total = db.session.scalar(user_archive_count_statement(user_id))
+    page, pages = user_orders_page(total, page, per_page)
+    orders = db.session.scalars(user_archive_statement(user_id, page, per_page)).all()
+    return {'orders': orders, 'total': total, 'page': page, 'pages': pages}
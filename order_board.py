@@ -0,0 +1,233 @@
+import base64
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import joinedload
+from models import db, Order, Tour, User, ORDER_STATUSES
+
+# Куда можно перевести заказ из каждой колонки: (значение, подпись)
+STATUS_CHOICES = {
+    'Ожидание': [('Ожидание', 'Ожидание'), ('Подтвержден', 'Подтвержден'), ('Отменен', 'Отменен')],
+    'Подтвержден': [('Ожидание', 'Ожидание'), ('Подтвержден', 'Подтвержден'),
+                    ('Завершен', 'Завершен'), ('Отменен', 'Отменен')],
+    'Завершен': [('Подтвержден', 'Подтвержден'), ('Завершен', 'Завершен')],
+    'Отменен': [('Отменен', 'Отменен'), ('Ожидание', 'Восстановить')],
+}
+
+# Сколько карточек отдаётся в колонку за один раз
+BOARD_PAGE_SIZE = 25
+
+
+def parse_order_filters(args):
+    """Разбирает фильтры доски из query-string.
+
+    Поддерживаются status, tour_id, user (id или логин), date_from и
+    date_to (дата создания заказа, включительно), а для выгрузки ещё
+    archived=1 — вместе с архивом. При неверных значениях выбрасывается
+    ValueError.
+    """
+    filters = {}
+
+    status = args.get('status')
+    if status:
+        if status not in ORDER_STATUSES:
+            raise ValueError(f'Неизвестный статус: {status}')
+        filters['status'] = status
+
+    tour_id = args.get('tour_id')
+    if tour_id:
+        filters['tour_id'] = int(tour_id)
+
+    user = args.get('user', '').strip()
+    if user:
+        filters['user'] = user
+
+    for key in ('date_from', 'date_to'):
+        value = args.get(key)
+        if value:
+            filters[key] = datetime.strptime(value, '%Y-%m-%d').date()
+
+    if args.get('archived') in ('1', 'true', 'True', 'on'):
+        filters['archived'] = True
+
+    return filters
+
+
+def order_filter_conditions(filters, model=Order):
+    """Условия WHERE для фильтров (кроме статуса); model — Order или OrderArchive"""
+    conditions = []
+    if 'tour_id' in filters:
+        conditions.append(model.tour_id == filters['tour_id'])
+
+    if 'user' in filters:
+        user = filters['user']
+        if user.isdigit():
+            conditions.append(model.user_id == int(user))
+        else:
+            user_id = select(User.id).where(User.username == user).scalar_subquery()
+            conditions.append(model.user_id == user_id)
+
+    if 'date_from' in filters:
+        start = datetime.combine(filters['date_from'], datetime.min.time())
+        conditions.append(model.created_at >= start)
+
+    if 'date_to' in filters:
+        end = datetime.combine(filters['date_to'] + timedelta(days=1), datetime.min.time())
+        conditions.append(model.created_at < end)
+
+    return conditions
+
+
+def apply_order_filters(query, filters):
+    """Накладывает фильтры (кроме статуса) на запрос заказов"""
+    return query.filter(*order_filter_conditions(filters))
+
+
+def bulk_selection(data):
+    """Условия WHERE для массовой операции над заказами.
+
+    data — форма или JSON. Либо перечисляются order_ids, либо при
+    scope=filter берутся фильтры доски (включая статус). Пустой выбор —
+    ValueError, чтобы случайно не задеть все заказы разом.
+    """
+    if data.get('scope') == 'filter':
+        filters = parse_order_filters(data)
+        # archived относится только к выгрузке и условием WHERE не является
+        filters.pop('archived', None)
+        if not filters:
+            raise ValueError('Не задан ни один фильтр')
+        conditions = order_filter_conditions(filters)
+        if 'status' in filters:
+            conditions.append(Order.status == filters['status'])
+        if not conditions:
+            raise ValueError('Не задан ни один фильтр')
+        return conditions
+
+    if hasattr(data, 'getlist'):
+        raw_ids = data.getlist('order_ids')
+    else:
+        raw_ids = data.get('order_ids') or []
+        if not isinstance(raw_ids, list):
+            raise ValueError('order_ids должен быть списком номеров заказов')
+    try:
+        order_ids = {int(order_id) for order_id in raw_ids}
+    except (TypeError, ValueError) as e:
+        raise ValueError('Некорректный номер заказа') from e
+    if not order_ids:
+        raise ValueError('Не выбрано ни одного заказа')
+    return [Order.id.in_(order_ids)]
+
+
+def encode_cursor(order):
+    """Курсор на позицию после заказа: (created_at, id)"""
+    raw = f'{order.created_at.isoformat()}|{order.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Обратное преобразование курсора, ValueError при мусоре на входе"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, order_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Неверный курсор: {cursor}') from e
+
+
+def board_statement():
+    """Заказы вместе с туром и пользователем, новые сверху"""
+    return (select(Order)
+            .options(joinedload(Order.tour, innerjoin=True),
+                     joinedload(Order.user, innerjoin=True))
+            .order_by(Order.created_at.desc(), Order.id.desc()))
+
+
+def status_page_statement(status, filters=None, cursor=None, limit=BOARD_PAGE_SIZE):
+    """Запрос страницы колонки: на одну строку больше, чтобы узнать, есть ли продолжение"""
+    statement = apply_order_filters(board_statement().where(Order.status == status), filters or {})
+    if cursor:
+        statement = statement.where(tuple_(Order.created_at, Order.id) < decode_cursor(cursor))
+    return statement.limit(limit + 1)
+
+
+def split_page(orders, limit=BOARD_PAGE_SIZE):
+    """(заказы страницы, курсор следующей страницы или None)"""
+    next_cursor = encode_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return orders[:limit], next_cursor
+
+
+def load_status_page(status, filters=None, cursor=None, limit=BOARD_PAGE_SIZE):
+    """Одна страница колонки доски.
+
+    Выборка идёт по индексу (status, created_at) от позиции курсора,
+    поэтому стоимость страницы не зависит от её номера. Возвращает
+    список заказов и курсор следующей страницы (None, если это конец).
+    """
+    orders = db.session.scalars(status_page_statement(status, filters, cursor, limit)).all()
+    return split_page(orders, limit)
+
+
+def status_counts_statement(filters=None):
+    return apply_order_filters(
+        select(Order.status, func.count(Order.id)), filters or {}
+    ).group_by(Order.status)
+
+
+def status_counts(filters=None):
+    """Количество заказов в каждой колонке одним GROUP BY"""
+    counts = dict.fromkeys(ORDER_STATUSES, 0)
+    counts.update(db.session.execute(status_counts_statement(filters)).all())
+    return counts
+
+
+def board_statuses(filters):
+    """Колонки, которые нужно загрузить: все или одна из фильтра"""
+    return [filters['status']] if 'status' in filters else list(ORDER_STATUSES)
+
+
+def build_board(filters, pages, counts, limit=BOARD_PAGE_SIZE):
+    """Доска из загруженных страниц колонок ({статус: заказы}) и счётчиков"""
+    board = {status: {'orders': [], 'next_cursor': None} for status in ORDER_STATUSES}
+    for status, orders in pages.items():
+        orders, next_cursor = split_page(orders, limit)
+        board[status] = {'orders': orders, 'next_cursor': next_cursor}
+
+    if 'status' in filters:
+        counts = {status: counts[status] if status in pages else 0 for status in ORDER_STATUSES}
+    return board, counts
+
+
+def load_order_board(filters=None, limit=BOARD_PAGE_SIZE):
+    """Первые страницы всех колонок и счётчики.
+
+    Число запросов постоянно: один на счётчики и по одному на колонку.
+    Если в фильтре задан статус, загружается только его колонка.
+    """
+    filters = filters or {}
+    pages = {
+        status: db.session.scalars(status_page_statement(status, filters, limit=limit)).all()
+        for status in board_statuses(filters)
+    }
+    return build_board(filters, pages, status_counts(filters), limit)
+
+
+def tour_choices_statement():
+    """Туры для фильтра доски"""
+    return select(Tour.id, Tour.name).order_by(Tour.name)
+
+
+def order_to_dict(order):
+    """Представление заказа для JSON-ответов"""
+    return {
+        'id': order.id,
+        'status': order.status,
+        'tour_id': order.tour_id,
+        'tour_name': order.tour.name,
+        'user_id': order.user_id,
+        'username': order.user.username,
+        'guests_count': order.guests_count,
+        'total_price': order.total_price,
+        'start_date': order.start_date.isoformat(),
+        'end_date': order.end_date.isoformat(),
+        'special_requests': order.special_requests,
+        'created_at': order.created_at.isoformat(),
+    }
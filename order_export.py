@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import select, union_all
+from models import db, Order, OrderArchive, Tour, User
+from order_board import order_filter_conditions
+
+# Формат выгрузки: MIME-тип ответа
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# Сколько строк читается из курсора и отдаётся клиенту за раз
+EXPORT_CHUNK_SIZE = 1000
+
+# Колонки выгрузки в порядке вывода: (имя, колонка)
+EXPORT_COLUMNS = (
+    ('order_id', Order.id),
+    ('created_at', Order.created_at),
+    ('status', Order.status),
+    ('user_id', User.id),
+    ('username', User.username),
+    ('user_email', User.email),
+    ('tour_id', Tour.id),
+    ('tour_name', Tour.name),
+    ('destination', Tour.destination),
+    ('guests_count', Order.guests_count),
+    ('total_price', Order.total_price),
+    ('start_date', Order.start_date),
+    ('end_date', Order.end_date),
+    ('contact_phone', Order.contact_phone),
+    ('contact_email', Order.contact_email),
+    ('special_requests', Order.special_requests),
+    ('updated_at', Order.updated_at),
+)
+
+
+def _export_select(filters, model):
+    conditions = order_filter_conditions(filters, model)
+    if 'status' in filters:
+        conditions.append(model.status == filters['status'])
+    return (
+        select(*((getattr(model, column.key) if column.class_ is Order else column).label(name)
+                 for name, column in EXPORT_COLUMNS))
+        .join(User, User.id == model.user_id)
+        .join(Tour, Tour.id == model.tour_id)
+        .where(*conditions)
+    )
+
+
+def export_query(filters):
+    """Заказы с колонками клиента и тура одним JOIN, в порядке id.
+
+    С filters['archived'] к живым заказам добавляется архив (UNION ALL):
+    id у заказа при переносе не меняется, поэтому порядок общий.
+    """
+    if not filters.get('archived'):
+        return _export_select(filters, Order).order_by(Order.id)
+    orders = union_all(_export_select(filters, Order), _export_select(filters, OrderArchive)).subquery()
+    return select(orders).order_by(orders.c.order_id)
+
+
+def iter_chunks(filters, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки выгрузки пачками по chunk_size.
+
+    yield_per включает серверный курсор (stream_results) на PostgreSQL,
+    поэтому в памяти одновременно не больше одной пачки, сколько бы
+    заказов ни было в таблице. Объекты ORM не создаются.
+    """
+    result = db.session.execute(export_query(filters), execution_options={'yield_per': chunk_size})
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def generate_csv(filters, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM, чтобы Excel открыл кириллицу без выбора кодировки
+    buffer.write('\ufeff')
+    writer.writerow(name for name, _ in EXPORT_COLUMNS)
+    yield buffer.getvalue()
+
+    for rows in iter_chunks(filters, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def generate_ndjson(filters, chunk_size=EXPORT_CHUNK_SIZE):
+    for rows in iter_chunks(filters, chunk_size):
+        yield ''.join(
+            json.dumps(row._asdict(), ensure_ascii=False, default=_json_value) + '\n' for row in rows
+        )
+
+
+def generate(export_format, filters, chunk_size=EXPORT_CHUNK_SIZE):
+    """Генератор кусков текста выгрузки в формате csv или ndjson"""
+    if export_format == 'csv':
+        return generate_csv(filters, chunk_size)
+    if export_format == 'ndjson':
+        return generate_ndjson(filters, chunk_size)
+    raise ValueError(f'Неизвестный формат выгрузки: {export_format}')
@@ -0,0 +1,142 @@
+import math
+from flask import g, has_request_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, contains_eager
+from cache import create_backend
+from models import db, Order, ORDER_STATUSES
+
+# Сколько заказов на странице «Мои заказы»
+ORDERS_PER_PAGE = 10
+
+# Заказы, которые ещё предстоят: их число показывается в навбаре
+ACTIVE_STATUSES = ('Ожидание', 'Подтвержден')
+
+
+def summary_statement(user_id):
+    return select(Order.status, func.count(Order.id)).where(Order.user_id == user_id).group_by(Order.status)
+
+
+def build_summary(rows):
+    """Сводка из строк (статус, количество): всего, активных и по статусам"""
+    by_status = dict.fromkeys(ORDER_STATUSES, 0)
+    by_status.update(rows)
+    return {
+        'total': sum(by_status.values()),
+        'active': sum(by_status[status] for status in ACTIVE_STATUSES),
+        'by_status': by_status,
+    }
+
+
+def load_summary(user_id):
+    """Сводка заказов пользователя.
+
+    Читается всегда с основной базы: после смены статуса администратором
+    реплика могла ещё не догнать, а результат попадёт в кеш.
+    """
+    return build_summary(db.session.execute(summary_statement(user_id), bind_arguments={'bind': db.engine}).all())
+
+
+class OrderSummaryCache:
+    """Кеш сводки заказов для навбара и профиля.
+
+    Сводка нужна на каждой странице клиента, поэтому лежит в бэкенде кеша
+    (CACHE_URL) и читается без запроса к базе. booking.py отмечает в
+    сессии пользователей, чьи заказы изменились, а после коммита их
+    записи удаляются. С LocalBackend другие воркеры видят старую сводку
+    не дольше ORDER_SUMMARY_TTL секунд.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.ttl = 300
+
+    def init_app(self, app):
+        if self.backend is None:
+            self.backend = create_backend(app.config.get('CACHE_URL'))
+        self.ttl = app.config.get('ORDER_SUMMARY_TTL', self.ttl)
+        app.extensions['order_summary'] = self
+
+    @staticmethod
+    def _key(user_id):
+        return f'orders:summary:{user_id}'
+
+    def get(self, user_id):
+        summary = self.cached(user_id)
+        if summary is None:
+            summary = self.store(user_id, load_summary(user_id))
+        return summary
+
+    def cached(self, user_id):
+        """Сводка из кеша или None"""
+        # Навбар и страница могут спросить сводку дважды за запрос
+        memo = g.setdefault('order_summaries', {}) if has_request_context() else {}
+        summary = memo.get(user_id)
+        if summary is None:
+            summary = self.backend.get(self._key(user_id))
+            if summary is not None:
+                memo[user_id] = summary
+        return summary
+
+    def store(self, user_id, summary):
+        self.backend.set(self._key(user_id), summary, self.ttl)
+        if has_request_context():
+            g.setdefault('order_summaries', {})[user_id] = summary
+        return summary
+
+    def invalidate(self, user_id):
+        self.backend.delete(self._key(user_id))
+        if has_request_context():
+            g.get('order_summaries', {}).pop(user_id, None)
+
+
+summary_cache = OrderSummaryCache()
+
+
+def orders_changed(*user_ids):
+    """Отмечает пользователей, чьи заказы меняются в текущей транзакции"""
+    db.session.info.setdefault('order_summary_user_ids', set()).update(user_ids)
+
+
+def bulk_orders_changed(conditions):
+    """То же для заказов под условиями (вызывать до UPDATE/DELETE)"""
+    orders_changed(*db.session.scalars(select(Order.user_id).where(*conditions).distinct()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_summaries(session):
+    for user_id in session.info.pop('order_summary_user_ids', ()):
+        summary_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_summaries(session):
+    session.info.pop('order_summary_user_ids', None)
+
+
+def user_orders_page(total, page, per_page=ORDERS_PER_PAGE):
+    """(страница, число страниц) с поправкой номера на допустимый диапазон"""
+    pages = max(1, math.ceil(total / per_page))
+    return min(max(page, 1), pages), pages
+
+
+def user_orders_statement(user_id, page, per_page=ORDERS_PER_PAGE):
+    """Заказы пользователя вместе с турами, новые сверху.
+
+    Читаются диапазоном по индексу (user_id, created_at).
+    """
+    return (select(Order)
+            .join(Order.tour)
+            .options(contains_eager(Order.tour))
+            .where(Order.user_id == user_id)
+            .order_by(Order.created_at.desc(), Order.id.desc())
+            .limit(per_page).offset((page - 1) * per_page))
+
+
+def load_user_orders(user_id, page, total, per_page=ORDERS_PER_PAGE):
+    """Страница заказов пользователя одним запросом.
+
+    total берётся из сводки, поэтому отдельный COUNT не нужен.
+    """
+    page, pages = user_orders_page(total, page, per_page)
+    orders = db.session.scalars(user_orders_statement(user_id, page, per_page)).all()
+    return {'orders': orders, 'total': total, 'page': page, 'pages': pages}
@@ -0,0 +1,121 @@
+import os
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """Очередь на хеширование переполнена или ответ не пришёл вовремя"""
+
+
+# Функции выполняются в процессах пула, поэтому лежат на уровне модуля
+def _generate(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _check(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+class PasswordHasher:
+    """Хеширование паролей в отдельных процессах.
+
+    scrypt и pbkdf2 занимают процессор на сотни миллисекунд. Если считать
+    их прямо в обработчике, волна входов съедает все воркеры gunicorn и
+    тормозит остальные страницы. Здесь хеши считает небольшой пул
+    процессов (PASSWORD_HASH_WORKERS), а число ожидающих задач ограничено
+    PASSWORD_HASH_QUEUE: лишние запросы сразу получают HasherBusy, а не
+    копятся в очереди. PASSWORD_HASH_WORKERS=0 — считать в самом
+    процессе, как раньше (так работают скрипты без init_app).
+
+    Параметры стоимости задаются строкой метода Werkzeug
+    (PASSWORD_HASH_METHOD, например scrypt:32768:8:1 или
+    pbkdf2:sha256:600000); хеши со старыми параметрами пересчитываются
+    при следующем успешном входе (см. needs_rehash).
+    """
+
+    def __init__(self):
+        self.method = 'pbkdf2'
+        self.workers = 0
+        self.timeout = 10
+        self.max_pending = 0
+        self.pending = 0
+        self._executor = None
+        self._pid = None
+        self._prefix = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.max_pending = self.workers + app.config.get('PASSWORD_HASH_QUEUE', 4 * self.workers)
+        self._prefix = None
+        app.extensions['password_hasher'] = self
+
+    def _pool(self):
+        # После fork воркера gunicorn пул родителя недоступен — создаём свой
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # multiprocessing и concurrent.futures нужны только пулу: они
+                # загружаются при первом хешировании, а не при старте воркера
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        from concurrent.futures import TimeoutError as FutureTimeout
+        from concurrent.futures.process import BrokenProcessPool
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise HasherBusy()
+            self.pending += 1
+        try:
+            return self._pool().submit(func, *args).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy()
+        except BrokenProcessPool:
+            # Процесс пула упал (например, его убил OOM): пересоздадим пул
+            # при следующем вызове, а этот хеш посчитаем на месте
+            with self._lock:
+                self._executor = None
+            return func(*args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def hash(self, password):
+        return self._run(_generate, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(_check, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Посчитан ли хеш с другими параметрами, чем PASSWORD_HASH_METHOD"""
+        if self._prefix is None:
+            # Werkzeug раскрывает короткие имена (scrypt → scrypt:32768:8:1),
+            # поэтому эталонный префикс берём из настоящего хеша
+            self._prefix = _generate('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+        }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,322 @@
+import threading
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import or_, select
+from cache import create_backend
+from catalog import catalog
+from models import db, PriceRule, Tour
+
+# Виды правил цены в форме администратора
+RULE_KINDS = {
+    'season': 'Сезонная цена',
+    'surcharge': 'Надбавка на даты',
+    'group': 'Групповая скидка',
+}
+
+# Дни недели в порядке date.weekday()
+WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+
+# Больше гостей форма бронирования не принимает
+MAX_GUESTS = 10
+
+# Сколько цен можно запросить одним вызовом API
+MAX_QUOTE_ITEMS = 500
+
+# Правило на даты после компиляции: не держит сессию SQLAlchemy
+DateRule = namedtuple('DateRule', 'date_from date_to weekdays percent amount')
+
+# Скомпилированные цены тура. rates[i] — цена с человека на день start + i
+# (None — правил на эти дни нет, цена равна base); factors[g] — множитель
+# групповой скидки для g гостей. rules и tiers нужны для дат за горизонтом
+# и для групп больше MAX_GUESTS.
+RateTable = namedtuple('RateTable', 'tour_id base start horizon rates factors rules tiers')
+
+Quote = namedtuple('Quote', 'tour_id start_date guests per_person discount_percent total')
+
+
+def _applies(rule, day):
+    if rule.date_from is not None and day < rule.date_from:
+        return False
+    if rule.date_to is not None and day > rule.date_to:
+        return False
+    return rule.weekdays is None or str(day.weekday()) in rule.weekdays
+
+
+def day_rate(base, rules, day):
+    """Цена с человека на день: проценты правил перемножаются, суммы складываются"""
+    factor, extra = 1.0, 0.0
+    for rule in rules:
+        if _applies(rule, day):
+            factor *= 1 + rule.percent / 100
+            extra += rule.amount
+    return round(max(base * factor + extra, 0), 2)
+
+
+def _group_factor(tiers, guests):
+    """Множитель скидки самой крупной группы, в которую попадает guests"""
+    index = bisect_right(tiers, (guests, float('inf'))) - 1
+    return tiers[index][1] if index >= 0 else 1.0
+
+
+def _rule_offsets(rule, start, horizon):
+    """Номера дней горизонта, на которые действует правило"""
+    first = 0 if rule.date_from is None else max((rule.date_from - start).days, 0)
+    last = horizon - 1 if rule.date_to is None else min((rule.date_to - start).days, horizon - 1)
+    if rule.weekdays is None:
+        return range(first, last + 1)
+    # По дню недели — шагом 7 от первого подходящего дня
+    weekday = (start.weekday() + first) % 7
+    return [offset
+            for digit in rule.weekdays
+            for offset in range(first + (int(digit) - weekday) % 7, last + 1, 7)]
+
+
+def compile_table(tour_id, base, rules, start, horizon):
+    """Таблица цен тура на horizon дней от start из его правил.
+
+    Каждое правило на даты проходит только по своим дням, поэтому сборка
+    стоит O(правил × дней) один раз, а цена на любой день горизонта —
+    обращение к массиву по индексу.
+    """
+    date_rules = tuple(DateRule(rule.date_from, rule.date_to, rule.weekdays or None,
+                                rule.percent or 0, rule.amount or 0)
+                       for rule in rules if rule.kind != 'group')
+    discounts = {}
+    for rule in rules:
+        if rule.kind == 'group' and rule.min_guests:
+            factor = 1 + (rule.percent or 0) / 100
+            # Из двух скидок для одной группы действует бо́льшая
+            discounts[rule.min_guests] = min(factor, discounts.get(rule.min_guests, factor))
+    tiers = tuple(sorted(discounts.items()))
+    factors = tuple(_group_factor(tiers, guests) for guests in range(MAX_GUESTS + 1))
+
+    rates = None
+    if date_rules:
+        multipliers = [1.0] * horizon
+        extras = [0.0] * horizon
+        touched = False
+        for rule in date_rules:
+            growth = 1 + rule.percent / 100
+            for offset in _rule_offsets(rule, start, horizon):
+                multipliers[offset] *= growth
+                extras[offset] += rule.amount
+                touched = True
+        if touched:
+            rates = array('d', (round(max(base * multiplier + extra, 0), 2)
+                                for multiplier, extra in zip(multipliers, extras)))
+    return RateTable(tour_id, base, start, horizon, rates, factors, date_rules, tiers)
+
+
+def price(table, day, guests):
+    """Quote по таблице: без запросов к базе"""
+    offset = (day - table.start).days
+    if 0 <= offset < table.horizon:
+        rate = table.rates[offset] if table.rates is not None else round(table.base, 2)
+    else:
+        rate = day_rate(table.base, table.rules, day)
+    factor = table.factors[guests] if 0 <= guests <= MAX_GUESTS else _group_factor(table.tiers, guests)
+    return Quote(table.tour_id, day, guests, rate, round((factor - 1) * 100, 2), round(rate * guests * factor, 2))
+
+
+def load_tables(tour_ids, start, horizon):
+    """Таблицы цен туров двумя запросами на любое их число: цены туров и правила"""
+    bases = dict(db.session.execute(select(Tour.id, Tour.price).where(Tour.id.in_(tour_ids))).all())
+    if not bases:
+        return {}
+    rules = db.session.scalars(
+        select(PriceRule)
+        .where(or_(PriceRule.tour_id.in_(bases), PriceRule.tour_id.is_(None)))
+        .order_by(PriceRule.id)
+    ).all()
+    common, by_tour = [], {}
+    for rule in rules:
+        if rule.tour_id is None:
+            common.append(rule)
+        else:
+            by_tour.setdefault(rule.tour_id, []).append(rule)
+    return {tour_id: compile_table(tour_id, base, common + by_tour.get(tour_id, []), start, horizon)
+            for tour_id, base in bases.items()}
+
+
+class PricingEngine:
+    """Расчёт цен заказов по скомпилированным таблицам цен туров.
+
+    Таблица тура собирается из его правил (price_rule) при первом
+    обращении и лежит в бэкенде кеша (CACHE_URL) и в памяти процесса
+    под ключом из версии каталога и сегодняшней даты. Изменение правил
+    или цены тура увеличивает версию каталога (catalog.invalidate()),
+    поэтому устаревшие таблицы просто перестают находиться.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.horizon = 400
+        self._local = {}
+        self._local_key = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        if self.backend is None:
+            self.backend = create_backend(app.config.get('CACHE_URL'))
+        self.horizon = app.config.get('PRICING_HORIZON_DAYS', self.horizon)
+        app.extensions['pricing'] = self
+
+    def tables(self, tour_ids):
+        """{tour_id: RateTable}; недостающие таблицы собираются одной пачкой"""
+        version, _ = catalog.state()
+        start = date.today()
+        with self._lock:
+            if self._local_key != (version, start):
+                self._local, self._local_key = {}, (version, start)
+            found = {tour_id: self._local[tour_id] for tour_id in tour_ids if tour_id in self._local}
+            self.hits += len(found)
+        missing = [tour_id for tour_id in tour_ids if tour_id not in found]
+        if not missing:
+            return found
+
+        prefix = f'pricing:{version}:{start.isoformat()}:'
+        loaded = {}
+        for tour_id in missing:
+            table = self.backend.get(f'{prefix}{tour_id}')
+            if table is not None:
+                loaded[tour_id] = table
+        absent = [tour_id for tour_id in missing if tour_id not in loaded]
+        compiled = load_tables(absent, start, self.horizon) if absent else {}
+        for tour_id, table in compiled.items():
+            self.backend.set(f'{prefix}{tour_id}', table, ttl=2 * 86400)
+        loaded.update(compiled)
+
+        with self._lock:
+            self.misses += len(compiled)
+            if self._local_key == (version, start):
+                self._local.update(loaded)
+        found.update(loaded)
+        return found
+
+    def quote(self, tour_id, start_date, guests):
+        """Цена одной поездки; LookupError, если тура нет"""
+        table = self.tables({tour_id}).get(tour_id)
+        if table is None:
+            raise LookupError(f'Тур {tour_id} не найден')
+        return price(table, start_date, guests)
+
+    def quote_many(self, items):
+        """Цены для многих (tour_id, дата начала, гостей) одним вызовом.
+
+        Таблицы всех упомянутых туров берутся разом, дальше каждая цена —
+        индекс в массиве и умножение. На месте неизвестного тура — None.
+        """
+        items = list(items)
+        tables = self.tables({tour_id for tour_id, _, _ in items})
+        return [price(tables[tour_id], start_date, guests) if tour_id in tables else None
+                for tour_id, start_date, guests in items]
+
+    def clear(self):
+        with self._lock:
+            self._local, self._local_key = {}, None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'tables': len(self._local), 'horizon': self.horizon}
+
+
+def quote_to_dict(quote):
+    return dict(quote._asdict(), start_date=quote.start_date.isoformat())
+
+
+def parse_quote_items(data):
+    """[(tour_id, дата, гостей)] из JSON {'items': [{tour_id, start_date, guests}, ...]}"""
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError('Передайте непустой список items')
+    if len(items) > MAX_QUOTE_ITEMS:
+        raise ValueError(f'Не больше {MAX_QUOTE_ITEMS} цен за запрос')
+    parsed = []
+    for number, item in enumerate(items, 1):
+        try:
+            guests = int(item.get('guests', 1))
+            parsed.append((int(item['tour_id']), datetime.strptime(item['start_date'], '%Y-%m-%d').date(), guests))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'items[{number}]: нужны tour_id, start_date (ГГГГ-ММ-ДД) и guests') from e
+        if not 1 <= guests <= MAX_GUESTS:
+            raise ValueError(f'items[{number}]: гостей должно быть от 1 до {MAX_GUESTS}')
+    return parsed
+
+
+def _parse_date(value, label):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError as e:
+        raise ValueError(f'{label}: дата в формате ГГГГ-ММ-ДД') from e
+
+
+def _parse_number(value, label, default=0.0):
+    if value in (None, ''):
+        return default
+    try:
+        return float(value)
+    except ValueError as e:
+        raise ValueError(f'{label}: нужно число') from e
+
+
+def parse_rule(form, tour_id=None):
+    """PriceRule из формы администратора; при неверных данных — ValueError"""
+    kind = form.get('kind')
+    if kind not in RULE_KINDS:
+        raise ValueError('Неизвестный вид правила')
+    rule = PriceRule(tour_id=tour_id, kind=kind, name=(form.get('name') or '').strip() or RULE_KINDS[kind],
+                     percent=_parse_number(form.get('percent'), 'Процент'),
+                     amount=_parse_number(form.get('amount'), 'Сумма с человека'))
+    if rule.percent <= -100:
+        raise ValueError('Процент должен быть больше -100')
+
+    if kind == 'group':
+        try:
+            rule.min_guests = int(form.get('min_guests') or 0)
+        except ValueError:
+            rule.min_guests = 0
+        if not 2 <= rule.min_guests <= MAX_GUESTS:
+            raise ValueError(f'Групповая скидка — от 2 до {MAX_GUESTS} гостей')
+        if rule.amount:
+            raise ValueError('Групповая скидка задаётся только процентом')
+        return rule
+
+    rule.date_from = _parse_date(form.get('date_from'), 'Начало')
+    rule.date_to = _parse_date(form.get('date_to'), 'Конец')
+    if rule.date_from and rule.date_to and rule.date_to < rule.date_from:
+        raise ValueError('Конец периода раньше начала')
+    weekdays = ''.join(sorted({day for day in form.getlist('weekdays') if len(day) == 1 and day in '0123456'}))
+    rule.weekdays = weekdays or None
+    if kind == 'season' and not (rule.date_from and rule.date_to):
+        raise ValueError('Для сезона укажите начало и конец периода')
+    if kind == 'surcharge' and not (rule.date_from or rule.date_to or rule.weekdays):
+        raise ValueError('Для надбавки укажите даты или дни недели')
+    if not rule.percent and not rule.amount:
+        raise ValueError('Укажите процент или сумму')
+    return rule
+
+
+def describe_rule(rule):
+    """Условия и размер правила одной строкой для списка правил"""
+    parts = []
+    if rule.date_from or rule.date_to:
+        since = rule.date_from.strftime('%d.%m.%Y') if rule.date_from else '…'
+        until = rule.date_to.strftime('%d.%m.%Y') if rule.date_to else '…'
+        parts.append(f'{since} — {until}')
+    if rule.weekdays:
+        parts.append(' '.join(WEEKDAYS[int(day)] for day in rule.weekdays))
+    if rule.min_guests:
+        parts.append(f'от {rule.min_guests} гостей')
+    if rule.percent:
+        parts.append(f'{rule.percent:+g}%')
+    if rule.amount:
+        parts.append(f'{rule.amount:+g} ₽ с человека')
+    return ', '.join(parts)
+
+
+pricing_engine = PricingEngine()
@@ -0,0 +1,242 @@
+import threading
+import time
+from datetime import date, timedelta
+from sqlalchemy import and_, case, delete, func, insert, select, union, update
+from analytics import CANCELLED_STATUS, REVENUE_STATUSES
+from cache import create_backend
+from catalog import catalog, snapshot_tour
+from models import db, Order, OrderArchive, SalesDaily, Tour, TourPair
+
+# Сколько похожих туров показывается на странице тура
+SIMILAR_LIMIT = 4
+
+# Сколько популярных туров хранится в каждом списке
+POPULAR_LIMIT = 6
+
+# За сколько последних дней считаются популярные туры
+POPULAR_PERIOD_DAYS = 90
+
+
+def _customer_tours():
+    """Пары (клиент, тур) без повторов по заказам и их архиву"""
+    return union(*(select(model.user_id, model.tour_id) for model in (Order, OrderArchive)))
+
+
+def rebuild_pairs(bind=None):
+    """Пересобирает tour_pair одним проходом по заказам.
+
+    Совместные заказы считаются в самой базе: пары (клиент, тур)
+    соединяются сами с собой по клиенту, и GROUP BY сразу даёт всю
+    матрицу одним INSERT ... SELECT. Учитываются заказы в любом статусе,
+    включая архив. Коммит — на вызывающем. Возвращает число строк.
+    """
+    bind = bind if bind is not None else db.session
+    first = _customer_tours().subquery('first')
+    second = _customer_tours().subquery('second')
+    bind.execute(delete(TourPair))
+    bind.execute(
+        insert(TourPair).from_select(
+            ['tour_id', 'other_tour_id', 'customers'],
+            select(first.c.tour_id, second.c.tour_id, func.count())
+            .select_from(first)
+            .join(second, and_(second.c.user_id == first.c.user_id, second.c.tour_id != first.c.tour_id))
+            .group_by(first.c.tour_id, second.c.tour_id)
+        )
+    )
+    return bind.scalar(select(func.count()).select_from(TourPair))
+
+
+def _increment(pairs):
+    """Прибавляет по клиенту к парам [(tour_id, other_tour_id)], создавая недостающие"""
+    if not pairs:
+        return
+    rows = [{'tour_id': tour_id, 'other_tour_id': other_id, 'customers': 1} for tour_id, other_id in pairs]
+    table = TourPair.__table__
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.tour_id, table.c.other_tour_id],
+            set_={'customers': table.c.customers + 1},
+        ), rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.tour_id == row['tour_id'], table.c.other_tour_id == row['other_tour_id'])
+            .values(customers=table.c.customers + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table), row)
+
+
+def order_created(order):
+    """Обновляет пары туров для нового заказа (до коммита, в той же транзакции).
+
+    Пары меняются, только если клиент заказывает этот тур впервые: тогда
+    с каждым его прежним туром прибавляется по клиенту в обе стороны.
+    Удаление заказов пары не уменьшает — это исправляет периодическая
+    пересборка (flask recommendations-rebuild).
+    """
+    # Без autoflush: сам новый заказ ещё не должен попасть в выборку
+    with db.session.no_autoflush:
+        booked = set(db.session.scalars(union(
+            select(Order.tour_id).where(Order.user_id == order.user_id),
+            select(OrderArchive.tour_id).where(OrderArchive.user_id == order.user_id),
+        )))
+    if order.tour_id in booked:
+        return
+    _increment([(order.tour_id, other_id) for other_id in booked]
+               + [(other_id, order.tour_id) for other_id in booked])
+
+
+def similar_statement(limit=SIMILAR_LIMIT):
+    """Для каждого тура — limit активных туров с наибольшим числом общих клиентов"""
+    rank = func.row_number().over(
+        partition_by=TourPair.tour_id,
+        order_by=(TourPair.customers.desc(), TourPair.other_tour_id),
+    ).label('rank')
+    ranked = (select(TourPair.tour_id, TourPair.other_tour_id, rank)
+              .join(Tour, Tour.id == TourPair.other_tour_id)
+              .where(Tour.is_active.is_(True))
+              .subquery())
+    return (select(ranked.c.tour_id, ranked.c.other_tour_id)
+            .where(ranked.c.rank <= limit)
+            .order_by(ranked.c.tour_id, ranked.c.rank))
+
+
+def popular_statement(since):
+    """(tour_id, заказов, выручка) активных туров с даты since — из витрины аналитики"""
+    bookings = func.sum(case((SalesDaily.status != CANCELLED_STATUS, SalesDaily.orders_count), else_=0))
+    revenue = func.sum(case((SalesDaily.status.in_(REVENUE_STATUSES), SalesDaily.revenue), else_=0))
+    return (select(SalesDaily.tour_id, bookings, revenue)
+            .join(Tour, Tour.id == SalesDaily.tour_id)
+            .where(Tour.is_active.is_(True), SalesDaily.day >= since)
+            .group_by(SalesDaily.tour_id))
+
+
+def popular_since(today=None):
+    return (today or date.today()) - timedelta(days=POPULAR_PERIOD_DAYS)
+
+
+def rank_popular(rows, limit=POPULAR_LIMIT):
+    """{'bookings': [id, ...], 'revenue': [id, ...]} из строк popular_statement"""
+    ranked = {}
+    for name, column in (('bookings', 1), ('revenue', 2)):
+        top = sorted((row for row in rows if row[column]), key=lambda row: (-row[column], row[0]))
+        ranked[name] = [row[0] for row in top[:limit]]
+    return ranked
+
+
+def tours_statement(tour_ids):
+    return select(Tour).where(Tour.id.in_(tour_ids))
+
+
+def needed_tour_ids(similar_rows, popular):
+    return {other_id for _, other_id in similar_rows} | {tour_id for ids in popular.values() for tour_id in ids}
+
+
+def build_index(similar_rows, popular, tours):
+    """Индекс рекомендаций из снимков туров: всё, что нужно страницам, без запросов"""
+    snapshots = {tour.id: snapshot_tour(tour) for tour in tours}
+    similar = {}
+    for tour_id, other_id in similar_rows:
+        if other_id in snapshots:
+            similar.setdefault(tour_id, []).append(snapshots[other_id])
+    return {
+        'similar': {tour_id: tuple(items) for tour_id, items in similar.items()},
+        'popular': {key: tuple(snapshots[tour_id] for tour_id in ids if tour_id in snapshots)
+                    for key, ids in popular.items()},
+    }
+
+
+def load_index():
+    """Три запроса к небольшим таблицам: tour_pair, sales_daily и туры из списков"""
+    similar_rows = db.session.execute(similar_statement()).all()
+    popular = rank_popular(db.session.execute(popular_statement(popular_since())).all())
+    tour_ids = needed_tour_ids(similar_rows, popular)
+    tours = db.session.scalars(tours_statement(tour_ids)).all() if tour_ids else []
+    return build_index(similar_rows, popular, tours)
+
+
+class RecommendationIndex:
+    """Готовые рекомендации для страниц каталога.
+
+    Индекс собирается из tour_pair и витрины аналитики, которые сами
+    обновляются вместе с заказами, и лежит в бэкенде кеша (CACHE_URL)
+    под ключом из версии каталога и номера интервала RECOMMENDATIONS_TTL.
+    Поэтому он пересобирается после правки туров и раз в интервал, а
+    страницы достают из него списки по id тура за O(1).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.ttl = 300
+        self._local = None
+        self._local_key = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        if self.backend is None:
+            self.backend = create_backend(app.config.get('CACHE_URL'))
+        self.ttl = app.config.get('RECOMMENDATIONS_TTL', self.ttl)
+        app.extensions['recommendations'] = self
+
+    def generation(self):
+        """Номер интервала: входит в ключ индекса и в ETag страниц с рекомендациями"""
+        return int(time.time() // self.ttl)
+
+    def _key(self):
+        version, _ = catalog.state()
+        return f'recommendations:{version}:{self.generation()}'
+
+    def _lookup(self, key):
+        with self._lock:
+            if self._local_key == key:
+                return self._local
+        value = self.backend.get(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._local, self._local_key = value, key
+
+    def _store(self, key, value):
+        self.backend.set(key, value, ttl=2 * self.ttl)
+        self._remember(key, value)
+
+    def get(self, loader=load_index):
+        key = self._key()
+        value = self._lookup(key)
+        if value is None:
+            value = loader()
+            self._store(key, value)
+        return value
+
+    async def get_async(self, loader):
+        """То же для асинхронных обработчиков: loader — корутинная функция"""
+        key = self._key()
+        value = self._lookup(key)
+        if value is None:
+            value = await loader()
+            self._store(key, value)
+        return value
+
+
+def similar_tours(index, tour_id, limit=SIMILAR_LIMIT):
+    """(туры, которые бронируют вместе с этим; популярные туры, если таких нет)"""
+    similar = index['similar'].get(tour_id, ())
+    if similar:
+        return similar, ()
+    return (), tuple(tour for tour in index['popular']['bookings'] if tour.id != tour_id)[:limit]
+
+
+recommendation_index = RecommendationIndex()
@@ -0,0 +1,306 @@
+import csv
+import json
+import time
+from sqlalchemy import bindparam, case, insert, select, tuple_, update
+from booking import sync_capacity
+from models import db, Tour
+
+# Сколько строк отправляется в базу одним executemany
+IMPORT_BATCH_SIZE = 500
+
+# Сколько ошибок хранится в отчёте; остальные только считаются
+MAX_REPORTED_ERRORS = 10000
+
+# Естественный ключ тура: по нему строка файла находит существующий тур
+NATURAL_KEY = ('name', 'destination')
+
+REQUIRED_FIELDS = ('name', 'description', 'price', 'duration_days', 'destination')
+OPTIONAL_FIELDS = ('image_url', 'is_active', 'capacity')
+
+# Строковые колонки: числа из JSON приводятся к строке, остальные типы — ошибка строки
+TEXT_FIELDS = ('name', 'description', 'destination', 'image_url')
+
+_TRUE = ('1', 'true', 'yes', 'да', 'y')
+_FALSE = ('0', 'false', 'no', 'нет', 'n', '')
+
+
+class ImportReport:
+    """Итог импорта: счётчики, ошибки по строкам и скорость"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self.ignored_columns = set()
+        self.committed = False
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds, 1) if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'committed': self.committed,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': self.rows_per_second,
+            'ignored_columns': sorted(self.ignored_columns),
+            'errors': [{'line': line, 'error': message} for line, message in self.errors],
+        }
+
+
+def _max_length(field):
+    return getattr(Tour.__table__.c[field].type, 'length', None)
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def validate_row(raw):
+    """Приводит строку файла к значениям колонок Tour или выбрасывает ValueError"""
+    row = {}
+    problems = []
+
+    for field in REQUIRED_FIELDS:
+        value = _text(raw.get(field))
+        if value is None or value == '':
+            problems.append(f'{field}: обязательное поле')
+        else:
+            row[field] = value
+    for field in OPTIONAL_FIELDS:
+        value = _text(raw.get(field))
+        if value is not None and value != '':
+            row[field] = value
+
+    # JSON может прислать список или объект вместо значения: такая строка
+    # должна стать ошибкой в отчёте, а не упасть при сборке ключа пачки
+    for field, value in list(row.items()):
+        if isinstance(value, bool):
+            allowed = field == 'is_active'
+        else:
+            allowed = isinstance(value, (str, int, float))
+        if not allowed:
+            problems.append(f'{field}: неверный тип значения ({type(value).__name__})')
+            del row[field]
+        elif field in TEXT_FIELDS and not isinstance(value, str):
+            row[field] = str(value)
+
+    for field in ('name', 'destination', 'image_url'):
+        limit = _max_length(field)
+        if field in row and limit and len(str(row[field])) > limit:
+            problems.append(f'{field}: длиннее {limit} символов')
+
+    if 'price' in row:
+        try:
+            row['price'] = float(str(row['price']).replace(',', '.'))
+            if row['price'] < 0:
+                problems.append('price: не может быть отрицательной')
+        except ValueError:
+            problems.append(f'price: не число ({row["price"]!r})')
+
+    for field in ('duration_days', 'capacity'):
+        if field in row:
+            try:
+                row[field] = int(row[field])
+                if row[field] < 1:
+                    problems.append(f'{field}: должно быть не меньше 1')
+            except (TypeError, ValueError):
+                problems.append(f'{field}: не целое число ({row[field]!r})')
+
+    if 'is_active' in row and not isinstance(row['is_active'], bool):
+        flag = str(row['is_active']).lower()
+        if flag in _TRUE:
+            row['is_active'] = True
+        elif flag in _FALSE:
+            row['is_active'] = False
+        else:
+            problems.append(f'is_active: ожидается да/нет ({row["is_active"]!r})')
+
+    if problems:
+        raise ValueError('; '.join(problems))
+    return row
+
+
+def iter_csv(stream):
+    """Строки CSV как словари: (номер строки файла, словарь)"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_json(stream, chunk_size=65536):
+    """Объекты из JSON-массива или NDJSON, без чтения файла целиком.
+
+    Массив разбирается по одному элементу через raw_decode, поэтому в
+    памяти держится только текущий кусок файла. Номер «строки» — номер
+    объекта, начиная с 1.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    number = 0
+    started = False
+    eof = False
+
+    while True:
+        # Пропускаем пробелы и разделители между объектами
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] in ',]'
+                                          or (not started and buffer[position] == '[')):
+            started = True
+            position += 1
+
+        if position >= len(buffer):
+            if eof:
+                return
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = chunk, 0, not chunk
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+            # Число в самом конце куска могло оборваться: дочитываем и разбираем заново
+            if end == len(buffer) and not eof:
+                raise json.JSONDecodeError('кусок закончился', buffer, end)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError(f'Объект {number + 1}: некорректный JSON')
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+
+        started = True
+        number += 1
+        position = end
+        yield number, value
+
+
+def detect_format(filename):
+    return 'json' if filename and filename.lower().endswith(('.json', '.ndjson', '.jsonl')) else 'csv'
+
+
+def _group_by_fields(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups
+
+
+def _upsert_batch(batch, report):
+    """Обновляет туры, найденные по естественному ключу, и вставляет остальные"""
+    # Повтор ключа в одной пачке: побеждает последняя строка
+    by_key = {}
+    for row in batch:
+        by_key[tuple(row[field] for field in NATURAL_KEY)] = row
+
+    key_columns = [getattr(Tour, field) for field in NATURAL_KEY]
+    existing = dict(
+        (tuple(key), tour_id) for *key, tour_id in db.session.execute(
+            select(*key_columns, Tour.id).where(tuple_(*key_columns).in_(list(by_key)))
+        )
+    )
+
+    inserts, updates = [], []
+    for key, row in by_key.items():
+        if key in existing:
+            updates.append((existing[key], row))
+        else:
+            inserts.append(row)
+
+    # executemany требует одинакового набора колонок, поэтому строки
+    # группируются по набору заполненных полей
+    table = Tour.__table__
+    connection = db.session.connection()
+    for params in _group_by_fields(inserts).values():
+        connection.execute(insert(table), params)
+    update_groups = {}
+    for tour_id, row in updates:
+        update_groups.setdefault(tuple(sorted(row)), []).append(
+            dict({'b_id': tour_id}, **{f'b_{field}': value for field, value in row.items()})
+        )
+    for fields, params in update_groups.items():
+        values = {field: bindparam(f'b_{field}') for field in fields}
+        if 'image_url' in fields:
+            # Новая ссылка — картинку в кеше (images.py) нужно скачать заново
+            values['image_digest'] = case((table.c.image_url == bindparam('b_image_url'), table.c.image_digest),
+                                          else_=None)
+        connection.execute(update(table).where(table.c.id == bindparam('b_id')).values(values), params)
+
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+    return [tour_id for tour_id, _ in updates]
+
+
+def import_tours(rows, batch_size=IMPORT_BATCH_SIZE, dry_run=False, strict=False):
+    """Импортирует туры из итератора (номер строки, словарь) одной транзакцией.
+
+    Каждая строка проверяется по колонкам Tour; строки с ошибками
+    пропускаются и попадают в отчёт. Остальные пачками по batch_size
+    обновляют тур с тем же (name, destination) или добавляются. При
+    dry_run или strict с ошибками транзакция откатывается. Возвращает
+    ImportReport.
+    """
+    report = ImportReport()
+    known = set(REQUIRED_FIELDS) | set(OPTIONAL_FIELDS)
+    batch, updated_ids = [], []
+
+    try:
+        for line, raw in rows:
+            report.rows += 1
+            if not isinstance(raw, dict):
+                report.add_error(line, 'ожидается объект с полями тура')
+                continue
+            report.ignored_columns.update(key for key in raw if key not in known and key is not None)
+            try:
+                batch.append(validate_row(raw))
+            except ValueError as e:
+                report.add_error(line, str(e))
+                continue
+            if len(batch) >= batch_size:
+                updated_ids += _upsert_batch(batch, report)
+                batch = []
+        if batch:
+            updated_ids += _upsert_batch(batch, report)
+        if updated_ids:
+            sync_capacity(updated_ids)
+    except (ValueError, csv.Error) as e:
+        # Файл оборвался или не разбирается дальше: импорт целиком отменяется
+        db.session.rollback()
+        if isinstance(e, UnicodeDecodeError):
+            e = 'файл должен быть в кодировке UTF-8'
+        report.add_error(report.rows + 1, str(e))
+        report.finish()
+        return report
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if dry_run or (strict and report.failed):
+        db.session.rollback()
+    else:
+        db.session.commit()
+        report.committed = True
+    report.finish()
+    return report
+
+
+def write_error_report(report, stream):
+    """Ошибки импорта в CSV: номер строки файла и описание"""
+    writer = csv.writer(stream)
+    writer.writerow(('line', 'error'))
+    writer.writerows(report.errors)
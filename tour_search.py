@@ -0,0 +1,170 @@
+import math
+import re
+from sqlalchemy import func, literal_column, or_, select, text
+from models import db, Tour
+from catalog import TourSnapshot
+
+TOURS_PER_PAGE = 24
+
+# Сколько первых страниц каталога без фильтров держится в кеше
+CACHED_PAGES = 5
+
+# Допустимые значения ?sort= и соответствующий порядок строк
+SORT_OPTIONS = {
+    'new': (Tour.created_at.desc(), Tour.id.desc()),
+    'price': (Tour.price.asc(), Tour.id.asc()),
+    '-price': (Tour.price.desc(), Tour.id.desc()),
+    'duration': (Tour.duration_days.asc(), Tour.id.asc()),
+    '-duration': (Tour.duration_days.desc(), Tour.id.desc()),
+    'name': (Tour.name.asc(), Tour.id.asc()),
+}
+DEFAULT_SORT = 'new'
+
+
+def parse_tour_filters(args, is_admin=False):
+    """Фильтры каталога из query-string.
+
+    q — полнотекстовый поиск, destination — точное направление,
+    price_min/price_max и days_min/days_max — диапазоны, sort — порядок,
+    page — номер страницы. Неактивные туры видит только администратор
+    (active=0 или active=all). Неразборчивые значения игнорируются.
+    """
+    filters = {'page': 1, 'sort': DEFAULT_SORT, 'active': True}
+
+    q = args.get('q', '').strip()
+    if q:
+        filters['q'] = q[:200]
+
+    destination = args.get('destination', '').strip()
+    if destination:
+        filters['destination'] = destination
+
+    for key, cast in (('price_min', float), ('price_max', float), ('days_min', int), ('days_max', int)):
+        value = args.get(key, '').strip()
+        if value:
+            try:
+                filters[key] = cast(value)
+            except ValueError:
+                pass
+
+    if args.get('sort') in SORT_OPTIONS:
+        filters['sort'] = args['sort']
+
+    if is_admin:
+        active = args.get('active', '1')
+        filters['active'] = None if active == 'all' else active != '0'
+
+    try:
+        filters['page'] = max(1, int(args.get('page', 1)))
+    except ValueError:
+        pass
+
+    return filters
+
+
+def cache_key(filters):
+    """Ключ для кеша каталога или None, если страницу кешировать не нужно.
+
+    Кешируются только первые CACHED_PAGES страниц без фильтров: сортировка
+    и active принимают несколько значений, поэтому ключей немного. Поиск,
+    направление и диапазоны идут в базу, иначе каждая вариация
+    query-string оставляла бы в кеше свою запись.
+    """
+    if set(filters) - {'page', 'sort', 'active'} or filters['page'] > CACHED_PAGES:
+        return None
+    return f"search:{filters['sort']}:{filters['active']}:{filters['page']}"
+
+
+def _fts_condition(q):
+    """Условие полнотекстового поиска для текущей СУБД"""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        query = func.plainto_tsquery('russian', q)
+        return literal_column('tour.search_vector').op('@@')(query), \
+            func.ts_rank(literal_column('tour.search_vector'), query).desc()
+
+    words = re.findall(r'\w+', q)
+    if dialect == 'sqlite' and words:
+        # Каждое слово — префикс в кавычках, чтобы пользовательский ввод
+        # не разбирался как синтаксис FTS5
+        match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+        ids = select(literal_column('rowid')).select_from(text('tour_fts')).where(
+            text('tour_fts MATCH :match').bindparams(match=match)
+        )
+        return Tour.id.in_(ids), None
+
+    pattern = f'%{q}%'
+    return or_(Tour.name.ilike(pattern), Tour.description.ilike(pattern)), None
+
+
+def search_query(filters):
+    """Условия WHERE и порядок строк каталога по фильтрам"""
+    conditions = []
+    if filters.get('active') is not None:
+        conditions.append(Tour.is_active == filters['active'])
+    if 'destination' in filters:
+        conditions.append(Tour.destination == filters['destination'])
+    if 'price_min' in filters:
+        conditions.append(Tour.price >= filters['price_min'])
+    if 'price_max' in filters:
+        conditions.append(Tour.price <= filters['price_max'])
+    if 'days_min' in filters:
+        conditions.append(Tour.duration_days >= filters['days_min'])
+    if 'days_max' in filters:
+        conditions.append(Tour.duration_days <= filters['days_max'])
+
+    order_by = SORT_OPTIONS[filters.get('sort', DEFAULT_SORT)]
+    if 'q' in filters:
+        condition, rank = _fts_condition(filters['q'])
+        conditions.append(condition)
+        # Без явной сортировки результаты поиска идут по релевантности
+        if rank is not None and filters.get('sort', DEFAULT_SORT) == DEFAULT_SORT:
+            order_by = (rank,) + order_by
+    return conditions, order_by
+
+
+def count_statement(conditions):
+    return select(func.count(Tour.id)).where(*conditions)
+
+
+def page_statement(conditions, order_by, page, per_page=TOURS_PER_PAGE):
+    columns = [getattr(Tour, field) for field in TourSnapshot._fields]
+    return (select(*columns).where(*conditions).order_by(*order_by)
+            .limit(per_page).offset((page - 1) * per_page))
+
+
+def page_count(total, per_page=TOURS_PER_PAGE):
+    return max(1, math.ceil(total / per_page))
+
+
+def search_result(rows, total, page, pages):
+    return {
+        'tours': [TourSnapshot(*row) for row in rows],
+        'total': total,
+        'page': page,
+        'pages': pages,
+    }
+
+
+def search_tours(filters, per_page=TOURS_PER_PAGE):
+    """Страница каталога по фильтрам.
+
+    Возвращает словарь с TourSnapshot текущей страницы, общим числом
+    найденных туров и номером страницы.
+    """
+    conditions, order_by = search_query(filters)
+    total = db.session.scalar(count_statement(conditions))
+    pages = page_count(total, per_page)
+    page = min(filters.get('page', 1), pages)
+    rows = db.session.execute(page_statement(conditions, order_by, page, per_page))
+    return search_result(rows, total, page, pages)
+
+
+def destinations_statement():
+    return select(Tour.destination).where(Tour.is_active.is_(True)).distinct().order_by(Tour.destination)
+
+
+def load_destinations():
+    """Список направлений для выпадающего фильтра"""
+    return [destination for destination, in db.session.execute(destinations_statement())]
@@ -0,0 +1,83 @@
+from collections import namedtuple
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from cache import TTLCache
+from models import db, User
+
+_UserFields = namedtuple('_UserFields', ['id', 'username', 'email', 'role', 'created_at'])
+
+
+class UserSnapshot(UserMixin, _UserFields):
+    """Неизменяемая копия пользователя для current_user.
+
+    Содержит только то, что нужно навбару, профилю и проверкам прав.
+    Если в обработчике нужна сама модель (например, чтобы изменить её),
+    её надо загрузить через db.session.get(User, current_user.id).
+    """
+    __slots__ = ()
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+def snapshot_user(user):
+    return UserSnapshot(*(getattr(user, field) for field in UserSnapshot._fields))
+
+
+class UserCache:
+    """Кеш снимков пользователей для user_loader.
+
+    Запись живёт USER_CACHE_TTL секунд. После коммита, изменившего или
+    удалившего пользователя (роль, пароль и т.п.), запись сразу удаляется
+    в этом процессе; в остальных воркерах она устареет по TTL.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache()
+
+    def init_app(self, app):
+        self.cache.maxsize = app.config.get('USER_CACHE_SIZE', self.cache.maxsize)
+        self.cache.ttl = app.config.get('USER_CACHE_TTL', self.cache.ttl)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        snapshot = self.cache.get(user_id)
+        if snapshot is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = snapshot_user(user)
+            self.cache.set(user_id, snapshot)
+        return snapshot
+
+    def invalidate(self, user_id):
+        self.cache.delete(user_id)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _remember_changed_user(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)